@@ -0,0 +1,123 @@
+# Animated glyphs from the tile atlas and a scheduler that redraws them
+
+# font-2_anim.png is loaded at ATLAS: one block of 256 tiles per frame,
+# indexed like the glyphs they replace
+ATLAS = 0xE000
+FRAME_STRIDE = 0x100
+ATLAS_FRAMES = 2
+# Glyphs whose atlas frames differ, the rest would animate to themselves
+ANIMATED = frozenset([0x26, 0x30, *range(0x40, 0x4d), *range(0x4e, 0x5b),
+                      *range(0x61, 0x7f), 0x83, 0x8c, 0x8d, *range(0xc0, 0xc5),
+                      0xca, 0xcc, 0xcd, 0xda, 0xdb, 0xdd, 0xe5, 0xe9, 0xea,
+                      *range(0xec, 0xf0), 0xf1, 0xf8])
+
+
+class AnimatedTile:
+    """A glyph drawn as frames in turn, each shown for period seconds."""
+    def __init__(self, frames, period=0.5):
+        self.frames = frames
+        self.period = period
+
+    def frame(self, now):
+        return int(now / self.period) % len(self.frames)
+
+    def glyph(self, now):
+        return self.frames[self.frame(now)]
+
+
+def atlas_tiles(period=0.5):
+    """{symbol: AnimatedTile} for every animated glyph of the atlas."""
+    return {chr(code): AnimatedTile([chr(ATLAS + FRAME_STRIDE * i + code)
+                                     for i in range(ATLAS_FRAMES)], period)
+            for code in ANIMATED}
+
+
+class _Layer:
+    def __init__(self):
+        # (x, y) -> (tile, color)
+        self.cells = {}
+        # tile -> cells showing it, they all change frame together
+        self.groups = {}
+        # tile -> frame last drawn
+        self.frames = {}
+        # Cells placed since the last tick, drawn whatever their frame
+        self.pending = set()
+
+
+class Animator:
+    """Keeps the animated cells of each Screen and redraws them as frames turn.
+
+    Cells are grouped by tile, so tick() only looks at each tile's frame
+    once and then draws the cells of the tiles whose frame changed, plus
+    cells placed since the last tick. Each screen gets one put_cells()
+    call per tick, so the cost follows the number of animated cells rather
+    than the size of the screen.
+    """
+    def __init__(self, tiles=None):
+        self.tiles = tiles if tiles is not None else {}
+        self.layers = {}
+
+    def tile(self, symbol):
+        """The AnimatedTile for symbol, None when it does not animate."""
+        return self.tiles.get(symbol)
+
+    def layer(self, screen):
+        layer = self.layers.get(screen)
+        if layer is None:
+            layer = self.layers[screen] = _Layer()
+        return layer
+
+    def place(self, screen, x, y, tile, color=None):
+        """Animate (x, y) of screen with tile, drawing it on the next tick."""
+        layer = self.layer(screen)
+        old = layer.cells.get((x, y))
+        if old is not None and old[0] is not tile:
+            self._ungroup(layer, old[0], (x, y))
+        layer.cells[(x, y)] = (tile, color)
+        layer.groups.setdefault(tile, set()).add((x, y))
+        layer.pending.add((x, y))
+
+    def remove(self, screen, x, y):
+        """Stop animating (x, y); whatever is drawn there stays."""
+        layer = self.layers.get(screen)
+        if layer is None or (x, y) not in layer.cells:
+            return
+        tile, color = layer.cells.pop((x, y))
+        self._ungroup(layer, tile, (x, y))
+        layer.pending.discard((x, y))
+
+    def clear(self, screen):
+        """Forget every animated cell of screen."""
+        self.layers.pop(screen, None)
+
+    @staticmethod
+    def _ungroup(layer, tile, cell):
+        group = layer.groups[tile]
+        group.discard(cell)
+        if not group:
+            del layer.groups[tile]
+            layer.frames.pop(tile, None)
+
+    def tick(self, now):
+        """Draw the cells whose frame changed at time now, returns how many."""
+        drawn = 0
+        for screen, layer in self.layers.items():
+            batch = []
+            pending = layer.pending
+            for tile, group in layer.groups.items():
+                frame = tile.frame(now)
+                if layer.frames.get(tile) == frame:
+                    continue
+                layer.frames[tile] = frame
+                glyph = tile.frames[frame]
+                for x, y in group:
+                    batch.append((x, y, glyph, layer.cells[(x, y)][1]))
+                pending.difference_update(group)
+            for x, y in pending:
+                tile, color = layer.cells[(x, y)]
+                batch.append((x, y, tile.frames[layer.frames[tile]], color))
+            pending.clear()
+            if batch:
+                screen.put_cells(batch)
+                drawn += len(batch)
+        return drawn
@@ -2,140 +2,199 @@
 
 # From: https://github.com/joekane/bltColor
 
+from array import array
+
 from bearlibterminal import terminal
 
-class bltColor(str):
+
+def _pack(a, r, g, b):
+    return (a << 24) | (r << 16) | (g << 8) | b
+
+
+def _clamp(v):
+    return max(min(int(v), 255), 0)
+
+
+class bltColor():
+    """ARGB color, interned so the same name or value shares one object.
+
+    str() gives the name it was created from (or the decimal ARGB value),
+    so instances can still be dropped into [color=...] tags, and int()
+    gives the ARGB value. Colors are equal, and hash alike, when their
+    ARGB values match, whatever they were created from. Names are
+    resolved through BearLibTerminal once and cached.
+    """
+    __slots__ = ('color', 'colorname')
+    _names = {}
+    _interned = {}
+    _palettes = {}
+    INTERN_LIMIT = 65536
+
     def __new__(cls, value, *args, **kwargs):
-        # explicitly only pass value to the str constructor
+        if isinstance(value, bltColor):
+            return value
         if isinstance(value, str):
             if any(char.isdigit() for char in value):
                 value = value.replace(" ", "")
-        return super(bltColor, cls).__new__(cls, value)
-
-    def __init__(self, color):
-        # long.__init__(self, terminal.color_from_name(color))
-
-        if isinstance(color, str):
-            self.colorname = color
-            self.color = terminal.color_from_name(self.colorname)
+            key = value
         else:
-            self.colorname = color
-            self.color = color
-            # super(bltColor, self).__init__()
+            key = int(value) & 0xFFFFFFFF
+        color = cls._interned.get(key)
+        if color is None:
+            if isinstance(key, str):
+                argb = cls._names.get(key)
+                if argb is None:
+                    if key.isdigit():
+                        argb = int(key) & 0xFFFFFFFF
+                    else:
+                        argb = terminal.color_from_name(key) & 0xFFFFFFFF
+                    cls._names[key] = argb
+            else:
+                argb = key
+            if len(cls._interned) >= cls.INTERN_LIMIT:
+                cls._interned.clear()
+            color = super(bltColor, cls).__new__(cls)
+            color.color = argb
+            color.colorname = str(key)
+            cls._interned[key] = color
+        return color
+
+    def __int__(self):
+        return self.color
+
+    __index__ = __int__
 
     def __str__(self):
         """ Returns object as str for use in formatting tags """
-        return str(self.colorname)
+        return self.colorname
+
+    def __repr__(self):
+        return "bltColor({!r})".format(self.colorname)
+
+    def __eq__(self, other):
+        if isinstance(other, bltColor):
+            return self.color == other.color
+        if isinstance(other, int):
+            return self.color == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
 
+    def __hash__(self):
+        return hash(self.color)
+
+    @classmethod
+    def from_argb(cls, a, r, g, b):
+        return cls(_pack(a, r, g, b))
 
     def __add__(self, color2):
         r1, g1, b1, a1 = self.getRGB()
-        r2, g2, b2, a2 = color2.getRGB()
-
-        return bltColor(str(terminal.color_from_argb(
-            a1,
-            min(r1 + r2, 255),
-            min(g1 + g2, 255),
-            min(b1 + b2, 255),
-        )))
+        r2, g2, b2, a2 = bltColor(color2).getRGB()
+        return bltColor(_pack(a1, min(r1 + r2, 255), min(g1 + g2, 255),
+                              min(b1 + b2, 255)))
 
     def __sub__(self, color2):
         r1, g1, b1, a1 = self.getRGB()
-        r2, g2, b2, a2 = color2.getRGB()
-
-        return bltColor(str(terminal.color_from_argb(
-            a1,
-            max(r1 - r2, 0),
-            max(g1 - g2, 0),
-            max(b1 - b2, 0),
-        )))
+        r2, g2, b2, a2 = bltColor(color2).getRGB()
+        return bltColor(_pack(a1, max(r1 - r2, 0), max(g1 - g2, 0),
+                              max(b1 - b2, 0)))
 
     def __mul__(self, color2):
+        r1, g1, b1, a1 = self.getRGB()
         if isinstance(color2, bltColor):
-            r1, g1, b1, a1 = self.getRGB()
             r2, g2, b2, a2 = color2.getRGB()
-            return bltColor(str(terminal.color_from_argb(
-                a1,
-                max(min(int(r1 * r2) // 255, 255), 0),
-                max(min(int(g1 * g2) // 255, 255), 0),
-                max(min(int(b1 * b2) // 255, 255), 0),
-            )))
-        else:
-            r1, g1, b1, a1 = self.getRGB()
-            r2, g2, b2, a2 = color2, color2, color2, 1.0
-            return bltColor(str(terminal.color_from_argb(
-                a1,
-                max(min(int(r1 * r2), 255), 0),
-                max(min(int(g1 * g2), 255), 0),
-                max(min(int(b1 * b2), 255), 0),
-            )))
+            return bltColor(_pack(a1, _clamp(r1 * r2 // 255), _clamp(g1 * g2 // 255),
+                                  _clamp(b1 * b2 // 255)))
+        return bltColor(_pack(a1, _clamp(r1 * color2), _clamp(g1 * color2),
+                              _clamp(b1 * color2)))
 
     __rmul__ = __mul__
 
     @staticmethod
     def color_map(color_list, keylist):
-        # TODO: List shoudl be tuple ( str , inex )
-        total_len = keylist[-1]
-
-        current_key = 0
-        color_map = []
-        for k, key in enumerate(keylist):
-            color_map.append(bltColor(color_list[k]))
-            try:
-                interp_num = keylist[current_key+1] - keylist[current_key] - 1
-                bias_inc = 1.0 / (interp_num + 2)
-                bias = bias_inc
-                for n in xrange(interp_num):
-                    colorA = bltColor(color_list[current_key]).getRGB()
-                    colorB = bltColor(color_list[current_key+1]).getRGB()
-
-                    a = max(min(int(colorA[3] + ((colorB[3] - colorA[3]) * bias)), 255), 0)
-                    r = max(min(int(colorA[0] + ((colorB[0] - colorA[0]) * bias)), 255), 0)
-                    g = max(min(int(colorA[1] + ((colorB[1] - colorA[1]) * bias)), 255), 0)
-                    b = max(min(int(colorA[2] + ((colorB[2] - colorA[2]) * bias)), 255), 0)
-
-                    color_map.append(bltColor(str(terminal.color_from_argb(a, r, g, b))))
-                    bias += bias_inc
-                current_key += 1
-            except:
-                pass
-        return color_map
+        """Gradient through color_list placed at keylist positions.
+
+        Built once per (color_list, keylist) and served from a cache after.
+        """
+        key = (tuple(str(c) for c in color_list), tuple(keylist))
+        palette = bltColor._palettes.get(key)
+        if palette is None:
+            palette = bltColor._palettes[key] = tuple(
+                bltColor(v) for v in bltColor._build_map(color_list, keylist))
+        return list(palette)
 
+    @staticmethod
+    def color_map_array(color_list, keylist):
+        """Same gradient as color_map, as an array('I') of ARGB values."""
+        return array('I', (c.color for c in bltColor.color_map(color_list, keylist)))
+
+    @staticmethod
+    def _build_map(color_list, keylist):
+        colors = [bltColor(c) for c in color_list]
+        values = []
+        for k in range(len(keylist)):
+            values.append(int(colors[k]))
+            if k + 1 >= len(keylist):
+                break
+            interp_num = keylist[k+1] - keylist[k] - 1
+            bias_inc = 1.0 / (interp_num + 2)
+            bias = bias_inc
+            colorA = colors[k].getRGB()
+            colorB = colors[k+1].getRGB()
+            for n in range(interp_num):
+                values.append(_lerp(colorA, colorB, bias))
+                bias += bias_inc
+        return values
 
     def getRGB(self):
         """ Provides RGB values of name, usually for use in alpha transparency """
-        #red = 0
-        #green = 0
-        #blue = 0
-        #alpha = 0
+        c = self.color
+        return (c >> 16) & 255, (c >> 8) & 255, c & 255, (c >> 24) & 255
 
-        #if isinstance(self.colorname, str):
-        blue = (self.color >> 0) & 255
-        green = (self.color >> 8) & 255
-        red = (self.color >> 16) & 255
-        alpha = (self.color >> 24) & 255
-        #print alpha, red, green, blue
+    def blend(self, color2, bias=0.5, alpha=255 ):
+        """Returns bltColor halfway between this color and color2"""
+        return bltColor(_lerp(self.getRGB(), bltColor(color2).getRGB(), bias))
 
+    def trans(self, alpha_value):
+        """Returns a color with the alpha_value"""
+        alpha_value = max(min(alpha_value, 255), 1)
+        return bltColor((self.color & 0xFFFFFF) | (alpha_value << 24))
 
 
-        return int(red), int(green), int(blue), int(alpha)
+def _lerp(colorA, colorB, bias):
+    """ARGB int between two (r, g, b, a) tuples."""
+    return _pack(_clamp(colorA[3] + (colorB[3] - colorA[3]) * bias),
+                 _clamp(colorA[0] + (colorB[0] - colorA[0]) * bias),
+                 _clamp(colorA[1] + (colorB[1] - colorA[1]) * bias),
+                 _clamp(colorA[2] + (colorB[2] - colorA[2]) * bias))
 
-    def blend(self, color2, bias=0.5, alpha=255 ):
-        """Returns bltColor halfway between this color and color2"""
-        colorA = self.getRGB()
-        colorB = color2.getRGB()
 
-        a = max(min(int(colorA[3] + ((colorB[3] - colorA[3]) * bias)), 255), 0)
-        r = max(min(int(colorA[0] + ((colorB[0] - colorA[0]) * bias)), 255), 0)
-        g = max(min(int(colorA[1] + ((colorB[1] - colorA[1]) * bias)), 255), 0)
-        b = max(min(int(colorA[2] + ((colorB[2] - colorA[2]) * bias)), 255), 0)
+# Batch operations over arrays of ARGB ints, no bltColor objects created
 
-        return bltColor(str(terminal.color_from_argb(a, r, g, b)))
+def blend_array(values, color2, bias=0.5):
+    """Each color in values moved bias of the way toward color2."""
+    target = bltColor(color2).getRGB()
+    out = array('I', values)
+    for i, v in enumerate(out):
+        out[i] = _lerp(((v >> 16) & 255, (v >> 8) & 255, v & 255, (v >> 24) & 255),
+                       target, bias)
+    return out
+
+
+def scale_array(values, factors):
+    """Each color's RGB multiplied by its factor, e.g. a light level per cell."""
+    out = array('I', values)
+    for i, (v, f) in enumerate(zip(out, factors)):
+        out[i] = ((v & 0xFF000000)
+                  | (_clamp(((v >> 16) & 255) * f) << 16)
+                  | (_clamp(((v >> 8) & 255) * f) << 8)
+                  | _clamp((v & 255) * f))
+    return out
 
-    def trans(self, alpha_value):
-        """Returns a color with the alpha_value"""
-        r, g, b, a= self.getRGB()
-        #print alpha_value, r, g, b
-        alpha_value = max(min(alpha_value, 255), 1)
-        return bltColor(str(terminal.color_from_argb(alpha_value, r, g, b)))
 
+def palette_lookup(palette, indices):
+    """ARGB value of palette[i] for every i in indices, clamped to its ends."""
+    last = len(palette) - 1
+    return array('I', (int(palette[min(max(int(i), 0), last)]) for i in indices))
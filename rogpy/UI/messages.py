@@ -0,0 +1,78 @@
+import textwrap
+import time
+from collections import deque
+
+
+class MessageLog():
+    """Bounded history of game messages, newest first.
+
+    Each entry keeps its wrapped lines, so drawing never re-wraps old
+    messages. A message equal to the newest one bumps a repeat counter
+    instead of adding a line. render() only draws when something changed.
+
+    With a palette, lines are drawn in palette[0] when new and step
+    through the rest over fade seconds, so rendering at a steady frame
+    rate redraws whenever a line reaches its next shade.
+    """
+    def __init__(self, width, capacity=50, palette=None, fade=4.0):
+        self.width = width
+        self.entries = deque(maxlen=capacity)
+        self.dirty = True
+        self.palette = palette
+        self.fade = fade
+        self.shades = None
+
+    def add(self, msg, now=None):
+        now = time.monotonic() if now is None else now
+        if self.entries and self.entries[-1][0] == msg:
+            entry = self.entries[-1]
+            entry[1] += 1
+            entry[2] = self.wrap("{} (x{})".format(msg, entry[1]))
+            entry[3] = now
+        else:
+            self.entries.append([msg, 1, self.wrap(msg), now])
+        self.dirty = True
+
+    def wrap(self, text):
+        return textwrap.wrap(text, self.width) or ['']
+
+    def visible(self, height):
+        """Up to height (line, time added) pairs, newest message first."""
+        out = []
+        for msg, count, lines, stamp in reversed(self.entries):
+            for line in lines:
+                if len(out) == height:
+                    return out
+                out.append((line, stamp))
+        return out
+
+    def lines(self, height):
+        """Up to height wrapped lines, newest message first."""
+        return [line for line, stamp in self.visible(height)]
+
+    def shade(self, stamp, now):
+        last = len(self.palette) - 1
+        if last == 0 or self.fade <= 0:
+            return 0
+        return min(int((now - stamp) * last / self.fade), last)
+
+    def render(self, window, height, now=None):
+        if not self.dirty and not self.palette:
+            return False
+        visible = self.visible(height)
+        shades = None
+        if self.palette:
+            now = time.monotonic() if now is None else now
+            shades = [self.shade(stamp, now) for line, stamp in visible]
+            if shades != self.shades:
+                self.dirty = True
+        if not self.dirty:
+            return False
+        window.clear_area(0, 0, self.width, height)
+        for cursor, (line, stamp) in enumerate(visible):
+            color = self.palette[shades[cursor]] if shades else None
+            window.add_str(0, cursor, line.ljust(self.width), color=color)
+        window.refresh()
+        self.shades = shades
+        self.dirty = False
+        return True
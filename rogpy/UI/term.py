@@ -1,7 +1,13 @@
 from sys import platform as _platform
 from contextlib import contextmanager
+from collections import deque
+import re
+import textwrap
 import traceback
 
+from UI.trace import RenderTrace
+from UI.animation import atlas_tiles
+
 try:
     import curses
     from textmodule import justify
@@ -10,13 +16,18 @@ except ImportError as e:
 
 
 class Terminal():
-    def __init__(self):
-        if _platform == "win32":
+    def __init__(self, env=None):
+        if env is not None:
+            self.env = env
+        elif _platform == "win32":
             self.env = "windows"
         elif _platform == "linux" or _platform == "linux2":
             self.env = "linux"
         else:
             raise Exception("Unrecognized operating system")
+        self.trace = None
+        # Animated glyphs by symbol, only the bearlib atlas has any
+        self.TILES = {}
 
     def get_term(self, y, x):
         self.max_y = y
@@ -35,8 +46,38 @@ class Terminal():
             self._w_set_keys()
             self.set_colors = self._w_set_colors
             self.count = 2
+
+        elif self.env == "headless":
+            self.mgr = self._h_mgr
+            self.newwin = self._h_new_win
+            self.getmaxyx = self._w_getmaxyx
+            self._h_set_keys()
+            self.set_colors = self._h_set_colors
+            self.chars = [[' '] * x for _ in range(y)]
+            self.colors = [[None] * x for _ in range(y)]
+            self.keys = deque()
+            self.refreshes = 0
         return self
 
+    def push_keys(self, keys):
+        """Queue scripted input for the headless backend's getch."""
+        self.keys.extend(keys)
+
+    def dump(self):
+        """Headless framebuffer contents as a list of strings, one per row."""
+        return [''.join(row) for row in self.chars]
+
+    def enable_trace(self, path='log', capacity=4096, sample=1, interval=1.0):
+        """Start recording drawn cells to path, see UI.trace.RenderTrace."""
+        if self.trace is None:
+            self.trace = RenderTrace(path, capacity, sample, interval)
+        return self.trace
+
+    def close_trace(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
     def get_count(self):
         return self.count
     
@@ -76,6 +117,7 @@ class Terminal():
         self.KEY_LEFT = curses.KEY_LEFT
         self.DOT = ord('.')
         self.Q = ord('q')
+        self.P = ord('p')
 
     def _w_set_keys(self):
         self.KEY_UP = bear.TK_UP
@@ -84,7 +126,27 @@ class Terminal():
         self.KEY_LEFT = bear.TK_LEFT
         self.Q = bear.TK_Q
         self.DOT = bear.TK_PERIOD
+        self.P = bear.TK_P
         
+    def _h_set_keys(self):
+        # Same codes as curses, so recorded curses input replays unchanged
+        self.KEY_DOWN = 258
+        self.KEY_UP = 259
+        self.KEY_LEFT = 260
+        self.KEY_RIGHT = 261
+        self.DOT = ord('.')
+        self.Q = ord('q')
+        self.P = ord('p')
+
+    def _h_set_colors(self):
+        self.TK_GREEN = "green"
+        self.TK_RED = "red"
+        self.TK_BLUE = "blue"
+        self.TK_GREY = "grey"
+        self.TK_BLACK = "black"
+        self.TK_WHITE = "white"
+        self.FADE = ["white", "light grey", "grey", "dark grey"]
+
     def _l_set_colors(self):
         curses.use_default_colors()
         for i in range(0, curses.COLORS):
@@ -93,7 +155,8 @@ class Terminal():
         self.TK_RED = curses.color_pair(2)
         self.TK_BLUE = curses.color_pair(5)
         self.TK_GREY = curses.color_pair(9)
-        
+        self.FADE = [curses.A_BOLD, curses.A_NORMAL, curses.A_DIM]
+
     def _w_set_colors(self):
         self.TK_GREEN = bear.color_from_name("green")
         self.TK_RED = bear.color_from_name("red")
@@ -101,6 +164,9 @@ class Terminal():
         self.TK_GREY = bear.color_from_name("grey")
         self.TK_BLACK = bear.color_from_name("#000000")
         self.TK_WHITE = bear.color_from_name("#FFFFFF")
+        # Message colors from newest to oldest
+        self.FADE = [bear.color_from_name(name) for name in
+                     ("white", "lighter grey", "light grey", "grey", "dark grey")]
         #self.TK_GREEN = bear.color_from_name("#00FF2F")
 
     @contextmanager
@@ -116,6 +182,7 @@ class Terminal():
             ex = traceback.format_exc()
         finally:
             curses.endwin()
+            self.close_trace()
             print(ex)
 
     @contextmanager
@@ -125,6 +192,7 @@ class Terminal():
             bear.open()
             bear.set("window: title='foo', size={}x{}, cellsize=16x24".format(self.max_x, self.max_y))
             bear.set("0xE000: font-2_anim.png, size=16x24")
+            self.TILES = atlas_tiles()
             bear.color("white")
             bear.refresh()
             yield self
@@ -132,8 +200,16 @@ class Terminal():
             ex = traceback.format_exc()
         finally:
             bear.close()
+            self.close_trace()
             print(ex)
 
+    @contextmanager
+    def _h_mgr(self):
+        yield self
+
+    def _h_new_win(self, w, h, x, y):
+        return Screen(self, self.env, w, h, x, y)
+
     def _l_new_win(self, w, h, x, y):
         return Screen(self, self.env, w, h, x, y)
 
@@ -156,7 +232,10 @@ class Screen():
             self.keypad = self._l_keypad
             self.refresh = self._l_refresh
             self.getch = self._l_getch
+            self.poll = self._l_poll
             self.clear_area = self._l_clear_area
+            self.blit = self._l_blit
+            self.put_cells = self._l_put_cells
         elif self.env == 'windows':
             self.scr = None
             self.layer = self.T.get_count()
@@ -165,12 +244,31 @@ class Screen():
             bear.crop(x, y, w, h)
             self.add_str = self._w_add_str
             self.getch = self._w_getch
+            self.poll = self._w_poll
             self.refresh = self._w_refresh
             self.clear_area = self._w_clear_area
+            self.blit = self._w_blit
+            self.put_cells = self._w_put_cells
+        elif self.env == 'headless':
+            self.scr = None
+            self.add_str = self._h_add_str
+            self.getch = self._h_getch
+            self.poll = self._h_getch
+            self.refresh = self._h_refresh
+            self.clear_area = self._h_clear_area
+            self.blit = self._h_blit
+            self.put_cells = self._h_put_cells
 
     def add_str(self, x, y, str_, color=None):
         pass
 
+    def blit(self, x, y, rows, colors=None):
+        pass
+
+    def put_cells(self, cells):
+        """Draw single glyphs from a list of (x, y, glyph, color)."""
+        pass
+
     def move(self, y, x):
         pass
 
@@ -182,6 +280,10 @@ class Screen():
 
     def getch(self):
         pass
+
+    def poll(self):
+        """Like getch, but None straight away when no key is waiting."""
+        pass
     
     def clear_area(self, x, y, w, h):
         pass
@@ -192,6 +294,17 @@ class Screen():
     def _w_getch(self):
         return bear.read()
 
+    def _l_poll(self):
+        self.scr.nodelay(True)
+        try:
+            c = self.scr.getch()
+        finally:
+            self.scr.nodelay(False)
+        return None if c == -1 else c
+
+    def _w_poll(self):
+        return bear.read() if bear.has_input() else None
+
     def _l_refresh(self):
         self.scr.refresh()
 
@@ -206,19 +319,23 @@ class Screen():
             if color is not None:
                 self.scr.addstr(y, x, str_, color)
                 newy, newx = self.scr.getyx()
+                if self.T.trace is not None:
+                    self.T.trace.record(newx, newy, str_)
                 return newy-y +1
                 # self.scr.addstr(y, x, str_, curses.color_pair(2))
             else:
                 self.scr.addstr(y, x, str_)
                 newy, newx = self.scr.getyx()
-                with open('log', 'a') as f:
-                    f.write("{} {} {}\n".format(newx, newy, str_))
+                if self.T.trace is not None:
+                    self.T.trace.record(newx, newy, str_)
                 return newy-y +1
         except curses.error:
             pass
 
     def _w_add_str(self, x, y, str_, color=None):
         bear.layer(self.layer)
+        if self.T.trace is not None:
+            self.T.trace.record(self.x+x, self.y+y, str_)
         if color is not None:
             #print("with color {}".format(color))
             prev = bear.state(bear.TK_COLOR)
@@ -230,6 +347,86 @@ class Screen():
             leng,height = bear.printf(self.x+x, self.y+y, str_)
             return height
 
+    @staticmethod
+    def runs(row, colors=None):
+        """Split a row into (offset, text, color) runs of the same color."""
+        if colors is None:
+            yield 0, row, None
+            return
+        start = 0
+        for i in range(1, len(row) + 1):
+            if i == len(row) or colors[i] != colors[start]:
+                yield start, row[start:i], colors[start]
+                start = i
+
+    def _l_blit(self, x, y, rows, colors=None):
+        """Draw rows of glyphs at (x, y), one addstr per same-color run."""
+        for j, row in enumerate(rows):
+            row_colors = colors[j] if colors is not None else None
+            for i, text, color in Screen.runs(row, row_colors):
+                if self.T.trace is not None:
+                    self.T.trace.record(x + i, y + j, text)
+                try:
+                    if color is not None:
+                        self.scr.addstr(y + j, x + i, text, color)
+                    else:
+                        self.scr.addstr(y + j, x + i, text)
+                except curses.error:
+                    pass
+
+    def _w_blit(self, x, y, rows, colors=None):
+        """Draw rows of glyphs at (x, y), one printf per same-color run.
+
+        The layer is selected and the color state saved once per call.
+        """
+        bear.layer(self.layer)
+        prev = bear.state(bear.TK_COLOR)
+        current = prev
+        for j, row in enumerate(rows):
+            row_colors = colors[j] if colors is not None else None
+            for i, text, color in Screen.runs(row, row_colors):
+                if color is None:
+                    color = prev
+                if color != current:
+                    bear.color(color)
+                    current = color
+                if self.T.trace is not None:
+                    self.T.trace.record(self.x + x + i, self.y + y + j, text)
+                text = (text.replace('[', '[[').replace(']', ']]')
+                            .replace('{', '{{').replace('}', '}}'))
+                bear.printf(self.x + x + i, self.y + y + j, text)
+        if current != prev:
+            bear.color(prev)
+
+    def _l_put_cells(self, cells):
+        for x, y, glyph, color in cells:
+            if self.T.trace is not None:
+                self.T.trace.record(x, y, glyph)
+            try:
+                if color is not None:
+                    self.scr.addstr(y, x, glyph, color)
+                else:
+                    self.scr.addstr(y, x, glyph)
+            except curses.error:
+                pass
+
+    def _w_put_cells(self, cells):
+        """One bear.put per cell, selecting the layer only once."""
+        bear.layer(self.layer)
+        prev = bear.state(bear.TK_COLOR)
+        current = prev
+        for x, y, glyph, color in cells:
+            if color is None:
+                color = prev
+            if color != current:
+                bear.color(color)
+                current = color
+            bear.put(self.x + x, self.y + y, ord(glyph))
+            if self.T.trace is not None:
+                self.T.trace.record(self.x + x, self.y + y, glyph)
+        if current != prev:
+            bear.color(prev)
+
     def _w_clear_area(self, x, y, w, h):
         bear.layer(self.layer)
         nx = self.x + x
@@ -238,4 +435,56 @@ class Screen():
         
     def _l_clear_area(self, x, y, w, h):
         #self.scr.clear()
-        pass
\ No newline at end of file
+        pass
+
+    _bbox = re.compile(r'^\[bbox=(\d+)\]')
+
+    def _h_put(self, x, y, text, color):
+        """Write text into the framebuffer, clipped to this window."""
+        if y < 0 or y >= self.h:
+            return
+        chars = self.T.chars[self.y + y]
+        colors = self.T.colors[self.y + y]
+        for i, ch in enumerate(text, x):
+            if 0 <= i < self.w:
+                chars[self.x + i] = ch
+                colors[self.x + i] = color
+
+    def _h_add_str(self, x, y, str_, color=None):
+        if self.T.trace is not None:
+            self.T.trace.record(self.x+x, self.y+y, str_)
+        m = Screen._bbox.match(str_)
+        if m:
+            lines = textwrap.wrap(str_[m.end():], int(m.group(1))) or ['']
+        else:
+            lines = [str_]
+        for j, line in enumerate(lines):
+            self._h_put(x, y + j, line, color)
+        return len(lines)
+
+    def _h_blit(self, x, y, rows, colors=None):
+        for j, row in enumerate(rows):
+            row_colors = colors[j] if colors is not None else None
+            for i, text, color in Screen.runs(row, row_colors):
+                if self.T.trace is not None:
+                    self.T.trace.record(self.x + x + i, self.y + y + j, text)
+                self._h_put(x + i, y + j, text, color)
+
+    def _h_put_cells(self, cells):
+        for x, y, glyph, color in cells:
+            if self.T.trace is not None:
+                self.T.trace.record(self.x + x, self.y + y, glyph)
+            self._h_put(x, y, glyph, color)
+
+    def _h_clear_area(self, x, y, w, h):
+        for j in range(y, y + h):
+            self._h_put(x, j, ' ' * w, None)
+
+    def _h_getch(self):
+        """Next scripted key, or Q once the script has run out."""
+        if self.T.keys:
+            return self.T.keys.popleft()
+        return self.T.Q
+
+    def _h_refresh(self):
+        self.T.refreshes += 1
@@ -0,0 +1,51 @@
+import threading
+from collections import deque
+
+
+class RenderTrace():
+    """Opt-in trace of drawn cells, kept in memory and written out in bulk.
+
+    record() only appends to a bounded deque, so the draw path never touches
+    the file system. A daemon thread drains the buffer to path every
+    interval seconds. Only every sample-th call is kept; once capacity
+    entries are waiting the oldest ones are dropped.
+    """
+    def __init__(self, path='log', capacity=4096, sample=1, interval=1.0):
+        self.path = path
+        self.sample = max(1, sample)
+        self.interval = interval
+        self.buffer = deque(maxlen=capacity)
+        self.seen = 0
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='render-trace',
+                                        daemon=True)
+        self._thread.start()
+
+    def record(self, x, y, str_):
+        self.seen += 1
+        if self.seen % self.sample:
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append((x, y, str_))
+
+    def flush(self):
+        with self._lock:
+            entries = []
+            while self.buffer:
+                entries.append(self.buffer.popleft())
+            if not entries:
+                return
+            with open(self.path, 'a') as f:
+                f.write(''.join("{} {} {}\n".format(*e) for e in entries))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Benchmarks for the game's hot paths.
+#
+#   python bench.py                       run and print timings
+#   python bench.py --save base.json      also store them as a baseline
+#   python bench.py --compare base.json   print % change against a baseline
+
+import argparse
+import itertools
+import json
+import queue
+import random
+import statistics
+import subprocess
+import time
+
+from maps.mapcreation import dMap
+from maps.tilegrid import FLOOR
+from UI.term import Terminal
+from ecs.components import Velocity, Renderable, Map, Fighter, TakesDamage
+from ecs.world import GameWorld, can_move
+from ecs.processors import ControlProcessor, RenderProcessor, RenderMapProcessor
+
+SEED = 1234
+MAP_SIZES = [(24, 16), (50, 32), (80, 50)]
+MAP_SETTINGS = [(110, 50, 60), (50, 30, 10), (300, 70, 100)]
+ENTITY_COUNTS = [10, 100, 1000]
+
+
+def measure(fn, setup=None, repeat=5, number=1):
+    """Median seconds per call of fn over repeat rounds of number calls."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return statistics.median(times)
+
+
+def bench_makemap(results):
+    for xsize, ysize in MAP_SIZES:
+        for fail, b1, mrooms in MAP_SETTINGS:
+            def run():
+                dMap(seed=SEED).makeMap(xsize, ysize, fail, b1, mrooms)
+
+            name = "makeMap {}x{} fail={} b1={} mrooms={}".format(
+                xsize, ysize, fail, b1, mrooms)
+            results[name] = measure(run)
+
+
+def crowd(n, size):
+    """World with n fighting entities scattered over a size x size area."""
+    world = GameWorld()
+    rng = random.Random(SEED)
+    ents = []
+    for _ in range(n):
+        ent = world.create_entity()
+        world.add_component(ent, Velocity())
+        world.add_component(ent, Fighter())
+        world.add_component(ent, TakesDamage(hp=10 ** 9))
+        world.add_component(ent, Renderable('g', rng.randrange(size),
+                                            rng.randrange(size), False, True))
+        ents.append(ent)
+    return world, ents, rng
+
+
+def bench_control(results):
+    for n in ENTITY_COUNTS:
+        size = max(16, int(n ** 0.5) * 4)
+        world, ents, rng = crowd(n, size)
+        world.add_processor(ControlProcessor(0, size, 0, size, ents[0], queue.Queue()))
+        vels = [world.component_for_entity(e, Velocity) for e in ents]
+
+        def run():
+            for vel in vels:
+                if rng.randint(0, 1) == 0:
+                    vel.x = rng.choice([1, -1])
+                else:
+                    vel.y = rng.choice([1, -1])
+            world.process()
+
+        results["ControlProcessor n={}".format(n)] = measure(run, number=10)
+
+        def moves():
+            for ent in ents:
+                can_move(world, ent, [0, 1])
+
+        results["can_move n={}".format(n)] = measure(moves, number=10)
+
+
+def headless(h, w):
+    term = Terminal('headless')
+    term.get_term(h, w)
+    term.set_colors()
+    return term, term.newwin(w, h, 0, 0)
+
+
+def bench_render(results):
+    for xsize, ysize in MAP_SIZES:
+        dmap = dMap(seed=SEED)
+        dmap.makeMap(xsize, ysize, 110, 50, 60)
+        term, screen = headless(ysize, xsize)
+        world = GameWorld()
+        map_ent = world.create_entity()
+        world.add_component(map_ent, Map(xsize, ysize, dmap.mapArr))
+        world.add_processor(RenderMapProcessor(screen))
+        tiles = world.component_for_entity(map_ent, Map)
+        floor = dmap.mapArr.find(FLOOR)
+        walker = world.create_entity()
+        world.add_component(walker, Renderable('g', *floor[0], False, True))
+        steps = itertools.cycle(floor)
+
+        def turn():
+            # A turn's worth of changes: an entity moves and a few tiles are set
+            world.move_entity(walker, *next(steps))
+            for x, y in floor[:4]:
+                tiles.set_tile(x, y, FLOOR)
+
+        results["RenderMapProcessor full {}x{}".format(xsize, ysize)] = measure(
+            world.process, setup=tiles.invalidate)
+        results["RenderMapProcessor turn {}x{}".format(xsize, ysize)] = measure(
+            world.process, setup=turn, repeat=100)
+
+    for n in ENTITY_COUNTS:
+        size = max(16, int(n ** 0.5) * 4)
+        world, ents, rng = crowd(n, size)
+        term, screen = headless(size, size)
+        world.add_processor(RenderProcessor(screen, ents[0]))
+        results["RenderProcessor n={}".format(n)] = measure(world.process, number=10)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+BENCHES = {'makemap': bench_makemap,
+           'control': bench_control,
+           'render': bench_render}
+
+
+def compare(results, baseline):
+    for name, t in results.items():
+        if name in baseline:
+            delta = (t - baseline[name]) / baseline[name] * 100
+            print("{:50} {:12.6f} ms {:+8.1f}%".format(name, t * 1000, delta))
+        else:
+            print("{:50} {:12.6f} ms      new".format(name, t * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the game's hot paths")
+    parser.add_argument('benches', nargs='*',
+                        help="benchmarks to run, any of {}, default all".format(
+                            ', '.join(sorted(BENCHES))))
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--compare', help="JSON baseline to compare against")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.benches or sorted(BENCHES):
+        BENCHES[name](results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("against {} (seed {})".format(baseline['commit'], baseline['seed']))
+        compare(results, baseline['results'])
+    else:
+        for name, t in results.items():
+            print("{:50} {:12.6f} ms".format(name, t * 1000))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'commit': git_commit(), 'seed': SEED, 'results': results},
+                      f, indent=2, sort_keys=True)
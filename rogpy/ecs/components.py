@@ -0,0 +1,140 @@
+from maps.tilegrid import OPAQUE
+from ecs.store import ArrayComponent
+
+
+##################################
+#  Define some Components:
+##################################
+class Velocity(ArrayComponent):
+    __slots__ = ()
+
+    def __init__(self, y=0, x=0):
+        super().__init__(x, y)
+
+    def __reduce__(self):
+        return Velocity, (self.y, self.x)
+
+
+class Renderable:
+    __slots__ = ('symbol', 'x', 'y', 'color', 'blocks', 'collides', '_store', '_row')
+
+    def __init__(self, symbol, posx, posy, blocks, collides, color=None):
+        self.symbol = symbol
+        self.x = posx
+        self.y = posy
+        self.color = color
+        self.blocks = blocks
+        self.collides = collides
+        # Row mirroring x and y in a world's ArrayStore, kept by move_entity
+        self._store = None
+        self._row = -1
+
+    def attach(self, store, ent):
+        self.detach()
+        self._store = store
+        self._row = store.append(ent, self, self.x, self.y)
+
+    def detach(self):
+        if self._store is not None:
+            self._store.remove(self._row)
+            self._store = None
+            self._row = -1
+
+    def __reduce__(self):
+        return Renderable, (self.symbol, self.x, self.y, self.blocks,
+                            self.collides, self.color)
+
+
+class Map:
+    translate = {0: '.',
+                 1: ' ',
+                 2: '#',
+                 3: '=',
+                 4: '+',
+                 5: '*'
+                }
+    def __init__(self, x, y, arr):
+        self.y = y
+        self.x = x
+        # TileGrid of dMap tile codes, shared with the generator
+        self.mapArr = arr
+        # Tiles changed since the last render, None forces a full redraw
+        self.dirty = None
+        # Bumped whenever a tile starts or stops blocking sight
+        self.version = 0
+        # Bumped by every set_tile
+        self.edits = 0
+
+    def glyph(self, x, y):
+        return Map.translate[self.mapArr[y][x]]
+
+    def glyph_rows(self):
+        translate = Map.translate
+        return [''.join([translate[c] for c in row]) for row in self.mapArr]
+
+    def set_tile(self, x, y, value):
+        if (self.mapArr[y][x] in OPAQUE) != (value in OPAQUE):
+            self.version += 1
+        self.mapArr[y][x] = value
+        self.edits += 1
+        if self.dirty is not None:
+            self.dirty.add((x, y))
+
+    def invalidate(self):
+        self.dirty = None
+
+
+class FieldOfView:
+    def __init__(self, radius=8):
+        self.radius = radius
+        self.visible = frozenset()
+        # One byte per map cell, set once the cell has been seen
+        self.explored = None
+        self.width = 0
+        # Cells that became visible or hidden since the last map render
+        self.changed = set()
+        # Position and Map.version the current visible set was computed for
+        self.origin = None
+        self.version = None
+        # Visible sets per viewer position, valid for one Map.version
+        self.cache = {}
+
+    def is_visible(self, x, y):
+        return (x, y) in self.visible
+
+    def is_explored(self, x, y):
+        return self.explored is not None and self.explored[y * self.width + x] == 1
+
+
+class Fighter:
+    __slots__ = ('damage',)
+
+    def __init__(self, damage=5):
+        self.damage = damage
+
+
+class TakesDamage:
+    __slots__ = ('hp', 'armorvalue', 'fire_res', 'ice_res', 'ele_res', 'poi_res')
+
+    def __init__(self, hp=10, armorvalue=1.0, fire_res=1.0, ice_res=1.0,
+                 ele_res=1.0, poi_res=1.0):
+        self.hp = hp
+        self.armorvalue = armorvalue
+        self.fire_res = fire_res
+        self.ice_res = ice_res
+        self.ele_res = ele_res
+        self.poi_res = poi_res
+
+
+class Actor:
+    def __init__(self, speed=100):
+        # Actions per 100 time units, the player's usual pace
+        self.speed = speed
+        # Scheduler time of the next action
+        self.next_time = 0
+
+
+class EnemyBehavior:
+    def __init__(self, mode='wander'):
+        # 'wander' moves at random, any other mode names a PathingProcessor field
+        self.mode = mode
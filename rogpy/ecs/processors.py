@@ -0,0 +1,374 @@
+import heapq
+import itertools
+import random
+
+import esper
+
+from ecs.components import (Velocity, Renderable, Map, FieldOfView, Fighter,
+                            TakesDamage, EnemyBehavior, Actor)
+from maps.fov import compute_fov
+from maps.dijkstra import walkable_mask, distance_map, flee_map, downhill
+
+
+################################
+#  Define some Processors:
+################################
+class TurnProcessor(esper.Processor):
+    """Energy scheduler deciding which Actors take part in a world pass.
+
+    Actors sit in a heap keyed by the time of their next action, each
+    action costing ACTION_COST * 100 / speed. A pass lasts as long as the
+    player's action; every action an actor has due before it ends is
+    counted in due and the actor requeued after it, so faster actors act
+    several times a pass. Actors farther than active_radius from the
+    player are requeued without acting. Entities without an Actor always
+    have one action due.
+    """
+    ACTION_COST = 1000
+
+    def __init__(self, player, active_radius=None):
+        super().__init__()
+        self.player = player
+        self.active_radius = active_radius
+        self.now = 0
+        self.due = {}
+        self.queue = []
+        self.queued = set()
+        self._order = itertools.count()
+
+    def cost(self, actor):
+        return max(1, self.ACTION_COST * 100 // max(1, actor.speed))
+
+    def reset(self):
+        """Forget the queue; it is rebuilt from each Actor's next_time."""
+        self.now = 0
+        self.due = {}
+        self.queue = []
+        self.queued = set()
+
+    def schedule(self, ent, time):
+        heapq.heappush(self.queue, (time, next(self._order), ent))
+        self.queued.add(ent)
+
+    def is_due(self, ent):
+        return ent in self.due or not self.world.has_component(ent, Actor)
+
+    def actions(self, ent):
+        """Number of actions ent takes this pass."""
+        if not self.world.has_component(ent, Actor):
+            return 1
+        return self.due.get(ent, 0)
+
+    def process(self):
+        for ent, actor in self.world.get_component(Actor):
+            if ent not in self.queued:
+                actor.next_time = max(actor.next_time, self.now)
+                self.schedule(ent, actor.next_time)
+        player = self.world.component_for_entity(self.player, Actor)
+        self.now = player.next_time
+        end = self.now + self.cost(player)
+        origin = self.world.component_for_entity(self.player, Renderable)
+        due = {}
+        queue = self.queue
+        while queue and queue[0][0] < end:
+            time, _, ent = heapq.heappop(queue)
+            self.queued.discard(ent)
+            if not self.world.has_component(ent, Actor):
+                continue
+            actor = self.world.component_for_entity(ent, Actor)
+            actor.next_time = time + self.cost(actor)
+            self.schedule(ent, actor.next_time)
+            if self.active_radius is not None and self.world.has_component(ent, Renderable):
+                rend = self.world.component_for_entity(ent, Renderable)
+                if max(abs(rend.x - origin.x), abs(rend.y - origin.y)) > self.active_radius:
+                    continue
+            due[ent] = due.get(ent, 0) + 1
+        self.due = due
+
+
+class ControlProcessor(esper.Processor):
+    def __init__(self, miny, maxy, minx, maxx, player, mq, corpse_color=None,
+                 turns=None):
+        super().__init__()
+        self.minx = minx
+        self.maxx = maxx - 1
+        self.miny = miny
+        self.maxy = maxy - 1
+        self.player = player
+        self.mq = mq
+        self.corpse_color = corpse_color
+        self.turns = turns
+
+    def process(self):
+        # Walk the Velocity columns, skipping entities without a Renderable:
+        vels = self.world.arrays[Velocity]
+        for ent, vel in zip(vels.entities, vels.owners):
+            if not self.world.has_component(ent, Renderable):
+                continue
+            if self.turns is not None and not self.turns.is_due(ent):
+                continue
+            self.step(ent, vel, self.world.component_for_entity(ent, Renderable))
+
+    def step(self, ent, vel, rend):
+        """Move ent by its Velocity, attacking whatever collides there.
+
+        An entity without a Fighter cannot attack, so a colliding entity
+        in the way stops it where it is.
+        """
+        attacked = False
+        tox = rend.x + vel.x
+        toy = rend.y + vel.y
+        for to_ent in self.world.positions.at(tox, toy):
+            tar = self.world.component_for_entity(to_ent, Renderable)
+            if tar.collides and ent != to_ent and not self.world.has_component(ent, Fighter):
+                attacked = True
+                vel.x = 0
+                vel.y = 0
+                break
+            if tar.collides and self.world.has_component(ent, Fighter):
+                if ent != to_ent:
+                    attacked = True
+                    vel.x = 0
+                    vel.y = 0
+                    hc = self.world.component_for_entity(to_ent, TakesDamage)
+                    fc = self.world.component_for_entity(ent, Fighter)
+                    hc.hp -= fc.damage
+                    if ent == self.player:
+                        self.mq.put(
+                            "Player attacked")
+                    if hc.hp <= 0:
+                        tar.collides = False
+                        tar.symbol = '~'
+                        tar.color = self.corpse_color
+                        break
+
+        if not attacked:
+            if ent == self.player:
+                self.mq.put("Player moved")
+            # Update the Renderable Component's position by it's Velocity.
+            # An example of keeping the sprite inside screen boundaries. Basically,
+            # adjust the position back inside screen boundaries if it tries to go outside:
+            tox = min(self.maxx, max(self.minx, tox))
+            toy = min(self.maxy, max(self.miny, toy))
+            self.world.move_entity(ent, tox, toy)
+            vel.x = 0
+            vel.y = 0
+
+
+class RenderProcessor(esper.Processor):
+    """Draws every Renderable the player can see, the player last.
+
+    With an animator, symbols it has an AnimatedTile for are placed there
+    instead of drawn, and the animator draws their current frame.
+    """
+    def __init__(self, screen, player, animator=None):
+        super().__init__()
+        self.screen = screen
+        self.player = player
+        self.animator = animator
+
+    def process(self):
+        fov = None
+        if self.world.has_component(self.player, FieldOfView):
+            fov = self.world.component_for_entity(self.player, FieldOfView)
+        if self.animator is not None:
+            self.animator.clear(self.screen)
+        # This will iterate over every Renderable's row, and render it:
+        rends = self.world.arrays[Renderable]
+        visible = fov.visible if fov is not None else None
+        for ent, x, y, rend in zip(rends.entities, rends.x, rends.y, rends.owners):
+            if ent == self.player:
+                continue
+            if visible is not None and (x, y) not in visible:
+                continue
+            self.draw(x, y, rend)
+
+        rend = self.world.component_for_entity(self.player, Renderable)
+        self.draw(rend.x, rend.y, rend)
+
+    def draw(self, x, y, rend):
+        tile = self.animator.tile(rend.symbol) if self.animator is not None else None
+        if tile is None:
+            self.screen.add_str(x, y, rend.symbol, color=rend.color)
+        else:
+            self.animator.place(self.screen, x, y, tile, rend.color)
+
+
+class RenderMapProcessor(esper.Processor):
+    """Draws the map once, then only changed tiles and cells left by entities.
+
+    With a viewer that has a FieldOfView, only its visible cells are drawn
+    normally, explored ones in memory_color and the rest left blank.
+    """
+    def __init__(self, screen, viewer=None, memory_color=None):
+        super().__init__()
+        self.screen = screen
+        self.viewer = viewer
+        self.memory_color = memory_color
+
+    def process(self):
+        vacated = self.world.positions.take_vacated()
+        fov = None
+        if self.viewer is not None:
+            fov = self.world.component_for_entity(self.viewer, FieldOfView)
+        for ent, map in self.world.get_component(Map):
+            if map.dirty is None:
+                if fov is None:
+                    self.screen.blit(0, 0, map.glyph_rows())
+                else:
+                    self.screen.blit(0, 0, *self.fov_rows(map, fov))
+            else:
+                cells = map.dirty | vacated
+                if fov is not None:
+                    cells |= fov.changed
+                for i, j in cells:
+                    if 0 <= i < map.x and 0 <= j < map.y:
+                        self.draw_cell(map, fov, i, j)
+            map.dirty = set()
+        if fov is not None:
+            fov.changed.clear()
+
+    def draw_cell(self, map, fov, i, j):
+        if fov is None or (i, j) in fov.visible:
+            self.screen.add_str(i, j, map.glyph(i, j))
+        elif fov.is_explored(i, j):
+            self.screen.add_str(i, j, map.glyph(i, j), color=self.memory_color)
+        else:
+            self.screen.add_str(i, j, ' ')
+
+    def fov_rows(self, map, fov):
+        rows = []
+        colors = []
+        for j, line in enumerate(map.glyph_rows()):
+            row = []
+            row_colors = []
+            for i, glyph in enumerate(line):
+                if (i, j) in fov.visible:
+                    row.append(glyph)
+                    row_colors.append(None)
+                elif fov.is_explored(i, j):
+                    row.append(glyph)
+                    row_colors.append(self.memory_color)
+                else:
+                    row.append(' ')
+                    row_colors.append(None)
+            rows.append(''.join(row))
+            colors.append(row_colors)
+        return rows, colors
+
+
+class FOVProcessor(esper.Processor):
+    """Recomputes FieldOfView only when its owner moved or sight lines changed."""
+    def __init__(self):
+        super().__init__()
+
+    def process(self):
+        for ent, map in self.world.get_component(Map):
+            break
+        else:
+            return
+        for ent, (fov, rend) in self.world.get_components(FieldOfView, Renderable):
+            if fov.explored is None:
+                fov.explored = bytearray(map.x * map.y)
+                fov.width = map.x
+            if fov.version != map.version:
+                fov.cache.clear()
+                fov.version = map.version
+                fov.origin = None
+            origin = (rend.x, rend.y)
+            if origin == fov.origin:
+                continue
+            visible = fov.cache.get(origin)
+            if visible is None:
+                visible = frozenset(compute_fov(map.mapArr, rend.x, rend.y, fov.radius))
+                fov.cache[origin] = visible
+            for x, y in visible - fov.visible:
+                fov.explored[y * fov.width + x] = 1
+            fov.changed |= visible ^ fov.visible
+            fov.visible = visible
+            fov.origin = origin
+
+
+class PathingProcessor(esper.Processor):
+    """Builds the Dijkstra maps every monster shares, at most once per turn.
+
+    fields['chase'] leads to the player, fields['flee'] away from them when
+    flee is set, and each add_goal name gets a field toward its cells. The
+    fields are only rebuilt when the player moves or a Map tile is set.
+    """
+    def __init__(self, player, flee=False):
+        super().__init__()
+        self.player = player
+        self.flee = flee
+        self.goals = {}
+        self.fields = {}
+        self.width = 0
+        self.height = 0
+        self._key = None
+
+    def add_goal(self, name, cells):
+        self.goals[name] = list(cells)
+        self._key = None
+
+    def reset(self):
+        self._key = None
+
+    def process(self):
+        for ent, map in self.world.get_component(Map):
+            break
+        else:
+            return
+        rend = self.world.component_for_entity(self.player, Renderable)
+        # Any edit can change walkability, not only those bumping version
+        key = (rend.x, rend.y, map.edits)
+        if key == self._key:
+            return
+        mask = walkable_mask(map.mapArr)
+        chase = distance_map(map.mapArr, [(rend.x, rend.y)], mask)
+        fields = {'chase': chase}
+        if self.flee:
+            fields['flee'] = flee_map(map.mapArr, chase, mask)
+        for name, cells in self.goals.items():
+            fields[name] = distance_map(map.mapArr, cells, mask)
+        self.fields = fields
+        self.width = map.x
+        self.height = map.y
+        self._key = key
+
+
+class MoveEnemyProcessor(esper.Processor):
+    """Picks each due enemy's next move, applied by ControlProcessor.
+
+    An enemy due more than once this pass takes its extra moves at once
+    through control, deciding each one from where the last left it.
+    """
+    def __init__(self, pathing=None, turns=None, rng=None, control=None):
+        super().__init__()
+        self.pathing = pathing
+        self.turns = turns
+        self.control = control
+        # Seeded by replays so wandering repeats exactly
+        self.rng = rng if rng is not None else random.Random()
+
+    def process(self):
+        fields = self.pathing.fields if self.pathing is not None else {}
+        for ent, (vel, ebe, rend) in self.world.get_components(Velocity, EnemyBehavior,
+                                                               Renderable):
+            if self.turns is not None and not self.turns.is_due(ent):
+                continue
+            self.plan(vel, ebe, rend, fields)
+            if self.turns is None or self.control is None:
+                continue
+            for _ in range(self.turns.actions(ent) - 1):
+                self.control.step(ent, vel, rend)
+                self.plan(vel, ebe, rend, fields)
+
+    def plan(self, vel, ebe, rend, fields):
+        field = fields.get(ebe.mode)
+        if field is not None:
+            vel.x, vel.y = downhill(field, self.pathing.width,
+                                    self.pathing.height, rend.x, rend.y)
+        elif self.rng.randint(0, 1) == 0:
+            vel.x = self.rng.choice([1, -1])
+        else:
+            vel.y = self.rng.choice([1, -1])
@@ -0,0 +1,121 @@
+import json
+import time
+from array import array
+from bisect import bisect_left
+
+
+# Histogram bucket edges in microseconds, four per doubling up to ~4s
+STEPS = 4
+EDGES = [2 ** (i / STEPS) for i in range(22 * STEPS)]
+
+
+##################################
+#  Processor timing:
+##################################
+class LatencyHistogram:
+    """Counts of durations in log-spaced buckets, four per doubling.
+
+    Bucket edges run from 1 microsecond to about 4 seconds, so a percentile
+    is reported as the upper edge of its bucket, within 19% of the truth.
+    """
+    def __init__(self):
+        self.buckets = array('L', [0]) * (len(EDGES) + 1)
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        us = seconds * 1e6
+        self.buckets[bisect_left(EDGES, us)] += 1
+        self.calls += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Duration in seconds below which q percent of the calls fell."""
+        if not self.calls:
+            return 0.0
+        rank = self.calls * q / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                if i == len(EDGES):
+                    return self.max
+                return min(EDGES[i] / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+    def stats(self):
+        return {'calls': self.calls, 'total': self.total, 'mean': self.mean(),
+                'p50': self.percentile(50), 'p99': self.percentile(99),
+                'max': self.max}
+
+
+class Profiler:
+    """Per-processor and per-frame latency histograms for a GameWorld.
+
+    The world reports each processor call through record() and each whole
+    process() through end_frame(); last holds the latest frame's times.
+    """
+    def __init__(self):
+        self.processors = {}
+        self.frames = LatencyHistogram()
+        self.last = {}
+        self.started = time.time()
+
+    def record(self, name, seconds):
+        hist = self.processors.get(name)
+        if hist is None:
+            hist = self.processors[name] = LatencyHistogram()
+        hist.add(seconds)
+        self.last[name] = seconds
+
+    def end_frame(self, seconds):
+        self.frames.add(seconds)
+
+    def reset(self):
+        self.processors.clear()
+        self.frames = LatencyHistogram()
+        self.last.clear()
+        self.started = time.time()
+
+    def stats(self):
+        return {'frames': self.frames.stats(),
+                'processors': {name: hist.stats()
+                               for name, hist in self.processors.items()}}
+
+    def lines(self, width):
+        """Overlay text: p50 and p99 in microseconds per processor and frame."""
+        name_width = max(width - 12, 4)
+        rows = [("proc", "p50", "p99")]
+        for name, hist in self.processors.items():
+            rows.append((name.replace('Processor', ''),
+                         hist.percentile(50), hist.percentile(99)))
+        rows.append(("frame", self.frames.percentile(50), self.frames.percentile(99)))
+        out = []
+        for name, p50, p99 in rows:
+            if not isinstance(p50, str):
+                p50 = int(p50 * 1e6)
+                p99 = int(p99 * 1e6)
+            out.append("{:<{w}.{w}}{:>6}{:>6}".format(name, p50, p99, w=name_width)[:width])
+        return out
+
+    def render(self, window, width, height):
+        window.clear_area(0, 0, width, height)
+        for cursor, line in enumerate(self.lines(width)[:height]):
+            window.add_str(0, cursor, line.ljust(width))
+        window.refresh()
+
+    def dump(self, path):
+        """Write stats() as JSON, durations in seconds."""
+        data = self.stats()
+        data['started'] = self.started
+        data['buckets'] = {name: list(hist.buckets)
+                           for name, hist in self.processors.items()}
+        data['edges'] = [edge / 1e6 for edge in EDGES]
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1)
@@ -0,0 +1,126 @@
+# Recorded key streams with keyframe snapshots, for replaying a game exactly
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+
+from ecs.snapshot import capture, encode, decode
+
+# magic, version, dMap seed (-1 for none), enemy RNG seed, turns between keyframes
+HEADER = struct.Struct('<4sHqqI')
+MAGIC = b'RGRP'
+VERSION = 1
+# block tag, payload bytes
+BLOCK = struct.Struct('<cI')
+# turn, keys read before it
+KEYFRAME = struct.Struct('<II')
+# Random.getstate(): 624 words and position, then gauss_next if any
+RNG_STATE = struct.Struct('<625I?d')
+
+
+def _pack_keys(keys):
+    if sys.byteorder != 'little':
+        keys = array('h', keys)
+        keys.byteswap()
+    return zlib.compress(keys.tobytes())
+
+
+def _unpack_keys(data):
+    keys = array('h')
+    keys.frombytes(zlib.decompress(data))
+    if sys.byteorder != 'little':
+        keys.byteswap()
+    return keys
+
+
+class ReplayRecorder:
+    """Appends every key read and a keyframe every interval turns to path.
+
+    The file is a HEADER followed by blocks: b'I' holds a zlib-compressed
+    run of int16 key codes, b'K' a keyframe of the turn, the number of keys
+    read so far, the enemy RNG state and a compressed snapshot. Key codes
+    are the terminal backend's own, so replays play back on the same one.
+    """
+    def __init__(self, path, map_seed, enemy_seed, interval=100):
+        self.interval = interval
+        self.keys = array('h')
+        self.count = 0
+        self.f = open(path, 'wb')
+        self.f.write(HEADER.pack(MAGIC, VERSION, -1 if map_seed is None else map_seed,
+                                 enemy_seed, interval))
+
+    def block(self, tag, payload):
+        self.f.write(BLOCK.pack(tag, len(payload)))
+        self.f.write(payload)
+
+    def key(self, c):
+        self.keys.append(c)
+        self.count += 1
+
+    def flush_keys(self):
+        if self.keys:
+            self.block(b'I', _pack_keys(self.keys))
+            self.keys = array('h')
+        self.f.flush()
+
+    def keyframe(self, world, dmap, rng, turn):
+        self.flush_keys()
+        version, words, gauss = rng.getstate()
+        state = RNG_STATE.pack(*words, gauss is not None, gauss or 0.0)
+        snapshot = zlib.compress(encode(capture(world, dmap)))
+        self.block(b'K', KEYFRAME.pack(turn, self.count) + state + snapshot)
+        self.f.flush()
+
+    def turn(self, world, dmap, rng, turn):
+        """Call after each processed turn; writes a keyframe every interval."""
+        if turn % self.interval == 0:
+            self.keyframe(world, dmap, rng, turn)
+
+    def close(self):
+        self.flush_keys()
+        self.f.close()
+
+
+class Keyframe:
+    def __init__(self, turn, key_index, rng_state, data):
+        self.turn = turn
+        self.key_index = key_index
+        self.rng_state = rng_state
+        self.data = data
+
+    def load(self):
+        """(dmap, [(entity, component)], next entity id) as snapshot.decode."""
+        return decode(zlib.decompress(self.data))
+
+
+class Replay:
+    """A file written by ReplayRecorder: keys holds every key code in order."""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            buf = f.read()
+        magic, version, map_seed, self.enemy_seed, self.interval = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a replay".format(path))
+        self.map_seed = None if map_seed < 0 else map_seed
+        self.keys = array('h')
+        self.keyframes = []
+        offset = HEADER.size
+        while offset + BLOCK.size <= len(buf):
+            tag, size = BLOCK.unpack_from(buf, offset)
+            offset += BLOCK.size
+            payload = buf[offset:offset + size]
+            offset += size
+            if tag == b'I':
+                self.keys.extend(_unpack_keys(payload))
+            elif tag == b'K':
+                turn, key_index = KEYFRAME.unpack_from(payload, 0)
+                fields = RNG_STATE.unpack_from(payload, KEYFRAME.size)
+                state = (3, tuple(fields[:625]), fields[626] if fields[625] else None)
+                self.keyframes.append(Keyframe(turn, key_index, state,
+                                               payload[KEYFRAME.size + RNG_STATE.size:]))
+        self.turns = [frame.turn for frame in self.keyframes]
+
+    def seek(self, turn):
+        """The last keyframe at or before turn."""
+        return self.keyframes[max(bisect_right(self.turns, turn) - 1, 0)]
@@ -0,0 +1,288 @@
+# Binary save games: the world's entities and components plus the level
+import os
+import struct
+import sys
+import threading
+from array import array
+
+from ecs.components import (Velocity, Renderable, Map, FieldOfView, Fighter,
+                            TakesDamage, EnemyBehavior, Actor)
+from maps.levelcache import pack_level, unpack_level
+
+# magic, version, dMap seed (-1 for none), next entity id, level bytes, sections
+HEADER = struct.Struct('<4sHqIII')
+MAGIC = b'RGSV'
+VERSION = 1
+# tag, number of records, payload bytes
+SECTION = struct.Struct('<4sII')
+
+# Fixed-size records, each starting with the entity id
+RENDER_ATTRS = struct.Struct('<HHB')    # symbol value, color value, blocks | collides << 1
+FIGHTER = struct.Struct('<ii')
+TAKES_DAMAGE = struct.Struct('<ii5d')
+ACTOR = struct.Struct('<iiq')
+BEHAVIOR = struct.Struct('<iH')         # mode value
+MAP = struct.Struct('<iiiI')            # x, y, version
+FOV = struct.Struct('<iHI')             # radius, explored bytes that follow
+
+
+def _column(arr):
+    if sys.byteorder != 'little':
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _uncolumn(typecode, data):
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+
+class _Values:
+    """Table of the symbols, colors and mode names records refer to by index."""
+    def __init__(self):
+        self.values = []
+        self.index = {}
+
+    def ref(self, value):
+        key = (type(value) is str, value)
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def pack(self):
+        parts = []
+        for v in self.values:
+            if v is None:
+                parts.append(b'n')
+            elif isinstance(v, str):
+                data = v.encode('utf-8')
+                parts.append(b's' + struct.pack('<H', len(data)) + data)
+            else:
+                parts.append(b'i' + struct.pack('<q', int(v)))
+        return b''.join(parts)
+
+    @staticmethod
+    def unpack(buf, count):
+        values = []
+        offset = 0
+        for _ in range(count):
+            kind = bytes(buf[offset:offset + 1])
+            offset += 1
+            if kind == b'n':
+                values.append(None)
+            elif kind == b's':
+                n, = struct.unpack_from('<H', buf, offset)
+                values.append(bytes(buf[offset + 2:offset + 2 + n]).decode('utf-8'))
+                offset += 2 + n
+            else:
+                values.append(struct.unpack_from('<q', buf, offset)[0])
+                offset += 8
+        return values
+
+
+##################################
+#  Saving:
+##################################
+def capture(world, dmap, level=None):
+    """Copy what a snapshot needs out of world and dmap.
+
+    Position columns are copied as bytes and the other components as
+    tuples, so the result can be encoded on another thread while the game
+    goes on. level is pack_level(dmap) when the caller already has it.
+    """
+    rends = world.arrays[Renderable]
+    vels = world.arrays[Velocity]
+    return {
+        'seed': -1 if dmap.seed is None else dmap.seed,
+        'next_id': world._next_entity_id,
+        'level': level if level is not None else pack_level(dmap),
+        'renderable': (_column(rends.entities), _column(rends.x), _column(rends.y),
+                       [(r.symbol, r.color, r.blocks, r.collides) for r in rends.owners]),
+        'velocity': (_column(vels.entities), _column(vels.x), _column(vels.y)),
+        'fighter': [(e, c.damage) for e, c in world.get_component(Fighter)],
+        'damage': [(e, c.hp, c.armorvalue, c.fire_res, c.ice_res, c.ele_res, c.poi_res)
+                   for e, c in world.get_component(TakesDamage)],
+        'actor': [(e, c.speed, c.next_time) for e, c in world.get_component(Actor)],
+        'behavior': [(e, c.mode) for e, c in world.get_component(EnemyBehavior)],
+        'map': [(e, c.x, c.y, c.version) for e, c in world.get_component(Map)],
+        'fov': [(e, c.radius, b'' if c.explored is None else bytes(c.explored))
+                for e, c in world.get_component(FieldOfView)],
+    }
+
+
+def encode(data):
+    """Snapshot file bytes for the output of capture()."""
+    values = _Values()
+    sections = []
+
+    def section(tag, count, payload):
+        sections.append(SECTION.pack(tag, count, len(payload)) + payload)
+
+    ents, xs, ys, attrs = data['renderable']
+    section(b'REND', len(attrs), ents + xs + ys + b''.join(
+        RENDER_ATTRS.pack(values.ref(symbol), values.ref(color),
+                          bool(blocks) | bool(collides) << 1)
+        for symbol, color, blocks, collides in attrs))
+    ents, xs, ys = data['velocity']
+    section(b'VELO', len(ents) // 4, ents + xs + ys)
+    section(b'FIGH', len(data['fighter']),
+            b''.join(FIGHTER.pack(*r) for r in data['fighter']))
+    section(b'DAMG', len(data['damage']),
+            b''.join(TAKES_DAMAGE.pack(*r) for r in data['damage']))
+    section(b'ACTR', len(data['actor']),
+            b''.join(ACTOR.pack(*r) for r in data['actor']))
+    section(b'BHVR', len(data['behavior']),
+            b''.join(BEHAVIOR.pack(e, values.ref(mode)) for e, mode in data['behavior']))
+    section(b'MAPC', len(data['map']),
+            b''.join(MAP.pack(*r) for r in data['map']))
+    section(b'FOVW', len(data['fov']),
+            b''.join(FOV.pack(e, radius, len(explored)) + explored
+                     for e, radius, explored in data['fov']))
+    section(b'VALS', len(values.values), values.pack())
+
+    level = data['level']
+    return b''.join([HEADER.pack(MAGIC, VERSION, data['seed'], data['next_id'],
+                                 len(level), len(sections)), level] + sections)
+
+
+def write_file(path, payload):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp, path)
+
+
+def save_snapshot(world, dmap, path):
+    write_file(path, encode(capture(world, dmap)))
+
+
+##################################
+#  Loading:
+##################################
+def decode(buf):
+    """(dmap, [(entity, component)], next entity id) from snapshot bytes.
+
+    Renderables and Velocities come in the order of their saved array rows.
+    """
+    buf = memoryview(buf)
+    magic, version, seed, next_id, level_len, nsections = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a snapshot")
+    offset = HEADER.size
+    dmap = unpack_level(buf[offset:offset + level_len], None if seed < 0 else seed)
+    offset += level_len
+    sections = {}
+    for _ in range(nsections):
+        tag, count, size = SECTION.unpack_from(buf, offset)
+        offset += SECTION.size
+        sections[tag] = (count, buf[offset:offset + size])
+        offset += size
+
+    values = _Values.unpack(sections[b'VALS'][1], sections[b'VALS'][0])
+    entities = []
+
+    def add(ent, comp):
+        entities.append((ent, comp))
+
+    count, payload = sections[b'REND']
+    n = count * 4
+    ents, xs, ys = (_uncolumn('i', payload[i * n:(i + 1) * n]) for i in range(3))
+    for ent, x, y, (symbol, color, flags) in zip(
+            ents, xs, ys, RENDER_ATTRS.iter_unpack(payload[3 * n:])):
+        add(ent, Renderable(values[symbol], x, y, bool(flags & 1), bool(flags & 2),
+                            color=values[color]))
+    count, payload = sections[b'VELO']
+    n = count * 4
+    ents, xs, ys = (_uncolumn('i', payload[i * n:(i + 1) * n]) for i in range(3))
+    for ent, x, y in zip(ents, xs, ys):
+        add(ent, Velocity(y, x))
+    for ent, damage in FIGHTER.iter_unpack(sections[b'FIGH'][1]):
+        add(ent, Fighter(damage))
+    for ent, *res in TAKES_DAMAGE.iter_unpack(sections[b'DAMG'][1]):
+        add(ent, TakesDamage(*res))
+    for ent, speed, next_time in ACTOR.iter_unpack(sections[b'ACTR'][1]):
+        actor = Actor(speed)
+        actor.next_time = next_time
+        add(ent, actor)
+    for ent, mode in BEHAVIOR.iter_unpack(sections[b'BHVR'][1]):
+        add(ent, EnemyBehavior(values[mode]))
+    for ent, x, y, version in MAP.iter_unpack(sections[b'MAPC'][1]):
+        map = Map(x, y, dmap.mapArr)
+        map.version = version
+        add(ent, map)
+    count, payload = sections[b'FOVW']
+    offset = 0
+    for _ in range(count):
+        ent, radius, size = FOV.unpack_from(payload, offset)
+        offset += FOV.size
+        fov = FieldOfView(radius)
+        if size:
+            fov.explored = bytearray(payload[offset:offset + size])
+            fov.width = dmap.size_x
+        offset += size
+        add(ent, fov)
+    return dmap, entities, next_id
+
+
+def load_snapshot(path):
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def restore(world, entities, next_id):
+    """Replace world's entities with decoded ones, keeping their ids."""
+    world.replace_entities(entities, next_id)
+
+
+class Autosaver:
+    """Writes snapshots on a background thread so saving never holds up a turn.
+
+    submit() only runs capture() on the caller's thread and hands the copy
+    over; encoding and writing happen on the saver thread, and a snapshot
+    still waiting there is replaced by a newer one. The level is packed
+    again only after its Map has been edited.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pending = None
+        self.closed = False
+        self.cond = threading.Condition()
+        self.level = None
+        self.level_key = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, world, dmap):
+        edits = [map.edits for ent, map in world.get_component(Map)]
+        key = (id(dmap.mapArr), tuple(edits))
+        if key != self.level_key:
+            self.level = pack_level(dmap)
+            self.level_key = key
+        data = capture(world, dmap, self.level)
+        with self.cond:
+            self.pending = data
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closed:
+                    self.cond.wait()
+                data = self.pending
+                self.pending = None
+                if data is None:
+                    return
+            write_file(self.path, encode(data))
+
+    def close(self):
+        """Write any pending snapshot and stop the thread."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
@@ -0,0 +1,100 @@
+from ecs.components import (Velocity, Renderable, Map, FieldOfView, Fighter,
+                            TakesDamage, EnemyBehavior, Actor)
+from ecs.world import GameWorld, can_move
+from ecs.processors import (ControlProcessor, RenderProcessor,
+                            RenderMapProcessor, MoveEnemyProcessor,
+                            FOVProcessor, PathingProcessor, TurnProcessor)
+
+
+##################################
+#  Building the game world:
+##################################
+def build_world(term, screen, dmap, mq, width, height, profiler=None, render=True,
+                rng=None, animator=None):
+    """The game's world on dmap: processors, map, player, an enemy and a tree.
+
+    Returns (world, player, renderers). Without render the two render
+    processors are not added to the world but still returned, so a caller
+    can run them itself when it wants a frame. rng drives wandering enemies,
+    and an Animator gets the animated Renderables to draw.
+    """
+    world = GameWorld(profiler)
+
+    player = world.create_entity()
+    turns = TurnProcessor(player, active_radius=width)
+    world.add_processor(turns, priority=105)
+
+    control_processor = ControlProcessor(0, height, 0, width, player, mq,
+                                         corpse_color=term.TK_RED, turns=turns)
+    world.add_processor(control_processor, priority=104)
+
+    pathing = PathingProcessor(player)
+    world.add_processor(pathing, priority=103)
+
+    enemy_mover = MoveEnemyProcessor(pathing, turns, rng, control_processor)
+    world.add_processor(enemy_mover, priority=102)
+
+    fov_processor = FOVProcessor()
+    world.add_processor(fov_processor, priority=101)
+
+    map_renderer = RenderMapProcessor(screen, player, memory_color=term.TK_BLUE)
+    render_processor = RenderProcessor(screen, player, animator)
+    renderers = [map_renderer, render_processor]
+    if render:
+        world.add_processor(map_renderer, priority=100)
+        world.add_processor(render_processor, priority=99)
+    else:
+        for renderer in renderers:
+            renderer.world = world
+
+    map = world.create_entity()
+    world.add_component(map, Map(dmap.size_x, dmap.size_y, dmap.mapArr))
+
+    p_pos_x, p_pos_y = dmap.get_entry()
+
+    dam_kwargs = {'hp': 20, 'armorvalue': 1.2, 'fire_res': 1.1, 'ice_res': 1.1,
+                  'ele_res': 1.1, 'poi_res': 1.1}
+    world.add_component(player, TakesDamage(**dam_kwargs))
+    world.add_component(player, Velocity(0, 0))
+    world.add_component(player, Fighter())
+    world.add_component(player, Actor(speed=100))
+    world.add_component(player, FieldOfView(radius=8))
+    world.add_component(player, Renderable('@', p_pos_x, p_pos_y, False, True,
+                                           color=term.TK_GREY))
+
+    # Create an enemy
+    spawn_enemy(world, 1, 1, term.TK_GREEN)
+
+    # Create a tree
+    tree = world.create_entity()
+    world.add_component(tree, Renderable('^', 2, 3, True, False, color=term.TK_WHITE))
+
+    return world, player, renderers
+
+
+def spawn_enemy(world, x, y, color, mode=None, speed=80):
+    """A goblin at (x, y); with a mode it moves by that EnemyBehavior."""
+    dam_kwargs = {'hp': 15, 'armorvalue': 1.0, 'fire_res': 1.0, 'ice_res': 1.0,
+                  'ele_res': 1.0, 'poi_res': 1.0}
+    enemy = world.create_entity()
+    world.add_component(enemy, TakesDamage(**dam_kwargs))
+    world.add_component(enemy, Velocity(0, 0))
+    world.add_component(enemy, Renderable('g', x, y, False, True, color=color))
+    world.add_component(enemy, Actor(speed=speed))
+    if mode is not None:
+        world.add_component(enemy, EnemyBehavior(mode))
+    return enemy
+
+
+def player_action(world, player, moving_to):
+    """Set the player's Velocity for a [dy, dx] move, False meaning wait.
+
+    Returns False when the move is blocked, in which case no time passes.
+    """
+    if moving_to and world.has_component(player, Velocity):
+        if not can_move(world, player, moving_to):
+            return False
+        vel = world.component_for_entity(player, Velocity)
+        vel.x = moving_to[1]
+        vel.y = moving_to[0]
+    return True
@@ -0,0 +1,83 @@
+from array import array
+
+
+##################################
+#  Struct-of-arrays storage:
+##################################
+class ArrayStore:
+    """Dense x and y columns for every component of one type in a world.
+
+    Row i belongs to entities[i] and its component owners[i].
+    Removing a row moves the last one into its place, so processors can
+    zip() the columns without gaps or per-entity attribute lookups.
+    """
+    def __init__(self):
+        self.entities = array('i')
+        self.x = array('i')
+        self.y = array('i')
+        self.owners = []
+
+    def __len__(self):
+        return len(self.owners)
+
+    def append(self, ent, comp, x, y):
+        self.entities.append(ent)
+        self.x.append(x)
+        self.y.append(y)
+        self.owners.append(comp)
+        return len(self.owners) - 1
+
+    def remove(self, row):
+        last = len(self.owners) - 1
+        if row != last:
+            self.entities[row] = self.entities[last]
+            self.x[row] = self.x[last]
+            self.y[row] = self.y[last]
+            moved = self.owners[row] = self.owners[last]
+            moved._row = row
+        self.entities.pop()
+        self.x.pop()
+        self.y.pop()
+        self.owners.pop()
+
+    def clear(self):
+        for comp in list(self.owners):
+            comp.detach()
+
+
+class ArrayComponent:
+    """Base for components whose x and y are a row of an ArrayStore.
+
+    Until it is attached to a world's store a component keeps a one-row
+    store of its own, so reads and writes work the same either way.
+    """
+    __slots__ = ('_store', '_row')
+
+    def __init__(self, x, y):
+        self._store = ArrayStore()
+        self._row = self._store.append(-1, self, x, y)
+
+    @property
+    def x(self):
+        return self._store.x[self._row]
+
+    @x.setter
+    def x(self, value):
+        self._store.x[self._row] = value
+
+    @property
+    def y(self):
+        return self._store.y[self._row]
+
+    @y.setter
+    def y(self, value):
+        self._store.y[self._row] = value
+
+    def attach(self, store, ent):
+        x, y = self.x, self.y
+        self._store.remove(self._row)
+        self._row = store.append(ent, self, x, y)
+        self._store = store
+
+    def detach(self):
+        self.attach(ArrayStore(), -1)
@@ -0,0 +1,163 @@
+import time
+
+import esper
+
+from ecs.components import Renderable, Velocity
+from ecs.store import ArrayStore
+
+
+##################################
+#  Spatial index and World:
+##################################
+class PositionIndex:
+    """Grid-keyed lookup of the entities standing on each (x, y) cell.
+
+    Cells left by a removed or moved entity are collected in vacated until
+    the map renderer takes them to repaint the tile underneath.
+    """
+    def __init__(self):
+        self.cells = {}
+        self.vacated = set()
+
+    def add(self, ent, x, y):
+        self.cells.setdefault((x, y), set()).add(ent)
+
+    def remove(self, ent, x, y):
+        cell = self.cells.get((x, y))
+        if cell is not None:
+            cell.discard(ent)
+            if not cell:
+                del self.cells[(x, y)]
+        self.vacated.add((x, y))
+
+    def at(self, x, y):
+        """Entities on the given cell, as a tuple so callers may move them."""
+        return tuple(self.cells.get((x, y), ()))
+
+    def take_vacated(self):
+        vacated = self.vacated
+        self.vacated = set()
+        return vacated
+
+    def clear(self):
+        self.cells.clear()
+        self.vacated.clear()
+
+
+class GameWorld(esper.World):
+    """esper.World that keeps a PositionIndex in sync with Renderables.
+
+    Positions must be changed through move_entity, adding, replacing and
+    removing Renderable components (or whole entities) is tracked here.
+    With a Profiler set, every processor call and frame is timed into it.
+
+    arrays holds an ArrayStore per type for processors that loop over all
+    Renderables or Velocities at once: Velocity x and y live there, while
+    Renderable positions are mirrored into it by move_entity.
+    """
+    def __init__(self, profiler=None):
+        super().__init__()
+        self.positions = PositionIndex()
+        self.profiler = profiler
+        self.arrays = {Renderable: ArrayStore(), Velocity: ArrayStore()}
+
+    def process(self, *args):
+        if self.profiler is None:
+            return super().process(*args)
+        clock = time.perf_counter
+        record = self.profiler.record
+        start = clock()
+        if self._dead_entities:
+            for entity in self._dead_entities:
+                self.delete_entity(entity, immediate=True)
+            self._dead_entities.clear()
+        for processor in self._processors:
+            before = clock()
+            processor.process(*args)
+            record(processor.__class__.__name__, clock() - before)
+        self.profiler.end_frame(clock() - start)
+
+    def move_entity(self, ent, x, y):
+        rend = self.component_for_entity(ent, Renderable)
+        if rend.x != x or rend.y != y:
+            self.positions.remove(ent, rend.x, rend.y)
+            rend.x = x
+            rend.y = y
+            self.positions.add(ent, x, y)
+            if rend._store is not None:
+                rend._store.x[rend._row] = x
+                rend._store.y[rend._row] = y
+
+    def add_component(self, entity, component_instance):
+        component_type = type(component_instance)
+        store = self.arrays.get(component_type)
+        if store is not None:
+            old = self._entities.get(entity, {}).get(component_type)
+            if old is not None and old is not component_instance:
+                if component_type is Renderable:
+                    self.positions.remove(entity, old.x, old.y)
+                old.detach()
+            if component_type is Renderable:
+                self.positions.add(entity, component_instance.x, component_instance.y)
+            component_instance.attach(store, entity)
+        super().add_component(entity, component_instance)
+
+    def remove_component(self, entity, component_type):
+        if component_type in self.arrays:
+            comp = self._entities[entity][component_type]
+            if component_type is Renderable:
+                self.positions.remove(entity, comp.x, comp.y)
+            comp.detach()
+        return super().remove_component(entity, component_type)
+
+    def delete_entity(self, entity, immediate=False):
+        if immediate:
+            components = self._entities.get(entity, {})
+            if Renderable in components:
+                rend = components[Renderable]
+                self.positions.remove(entity, rend.x, rend.y)
+            for component_type in self.arrays:
+                if component_type in components:
+                    components[component_type].detach()
+        super().delete_entity(entity, immediate)
+
+    def replace_entities(self, components, next_id):
+        """Swap every entity for the (entity, component) pairs given, keeping ids.
+
+        Fills the esper tables, position index and arrays directly instead
+        of going through add_component, for loading whole saves. Array rows
+        follow the order of the pairs. Processors with a reset() method
+        drop whatever they cached about the old entities.
+        """
+        self.clear_database()
+        entities = self._entities
+        by_type = self._components
+        for ent, comp in components:
+            component_type = type(comp)
+            entities.setdefault(ent, {})[component_type] = comp
+            by_type.setdefault(component_type, set()).add(ent)
+            store = self.arrays.get(component_type)
+            if store is not None:
+                comp.attach(store, ent)
+                if component_type is Renderable:
+                    self.positions.add(ent, comp.x, comp.y)
+        self._next_entity_id = next_id
+        for processor in self._processors:
+            if hasattr(processor, 'reset'):
+                processor.reset()
+
+    def clear_database(self):
+        super().clear_database()
+        self.positions.clear()
+        for store in self.arrays.values():
+            store.clear()
+
+
+def can_move(world, obj, vect):
+    ty = world.component_for_entity(obj, Renderable).y + vect[0]
+    tx = world.component_for_entity(obj, Renderable).x + vect[1]
+
+    for ent in world.positions.at(tx, ty):
+        if world.component_for_entity(ent, Renderable).blocks:
+            return False
+    return True
@@ -1,206 +1,38 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import argparse
+import asyncio
+import os
 import sys
-import esper
+import time
 import random
 import queue
 
-from maps.mapcreation import dMap
+from maps.levelcache import LevelCache
 from UI.term import Terminal
+from UI.messages import MessageLog
+from UI.animation import Animator
+from ecs.profiling import Profiler
+from ecs.processors import FOVProcessor
+from ecs.spawn import build_world, player_action
+from ecs.snapshot import Autosaver, load_snapshot, restore
+from ecs.replay import Replay, ReplayRecorder
 
 
 
-##################################
-#  Define some Components:
-##################################
-class Velocity:
-    def __init__(self, y=0, x=0):
-        self.x = x
-        self.y = y
-
-
-class Renderable:
-    def __init__(self, symbol, posx, posy, blocks, collides, color=None):
-        self.symbol = symbol
-        self.x = posx
-        self.y = posy
-        self.color = color
-        self.blocks = blocks
-        self.collides = collides
-
-
-
-class Map:
-    translate = {0: '.',
-                 1: ' ',
-                 2: '#',
-                 3: '=',
-                 4: '+',
-                 5: '*'
-                }
-    def __init__(self, x, y, arr):
-        self.y = y
-        self.x = x
-        self.mapArr = arr
-        
-        for j in range(self.y):
-            for i in range(self.x):
-                self.mapArr[j][i] = Map.translate[self.mapArr[j][i]]
-                
-
-
-
-class Fighter:
-    def __init__(self, damage=5):
-        self.damage = damage
-
-
-class TakesDamage:
-    def __init__(self, hp=10, armorvalue=1.0, fire_res=1.0, ice_res=1.0,
-                 ele_res=1.0, poi_res=1.0):
-        self.hp = hp
-        self.armorvalue = armorvalue
-        self.fire_res = fire_res
-        self.ice_res = ice_res
-        self.ele_res = ele_res
-        self.poi_res = poi_res
-
-
-class EnemyBehavior:
-    pass
-
-
-################################
-#  Define some Processors:
-################################
-class ControlProcessor(esper.Processor):
-    def __init__(self, miny, maxy, minx, maxx):
-        super().__init__()
-        self.minx = minx
-        self.maxx = maxx - 1
-        self.miny = miny
-        self.maxy = maxy - 1
-
-    def process(self):
-
-        # This will iterate over every Entity that has BOTH of these components:
-        for ent, (vel, rend) in self.world.get_components(Velocity, Renderable):
-            attacked = False
-            tox = rend.x + vel.x
-            toy = rend.y + vel.y
-            for to_ent, tar in self.world.get_component(Renderable):
-                if tar.x == tox and tar.y == toy and tar.collides and world.has_component(ent, Fighter):
-                    if ent != to_ent:
-                        attacked = True
-                        vel.x = 0
-                        vel.y = 0
-                        hc = self.world.component_for_entity(to_ent, TakesDamage)
-                        fc = self.world.component_for_entity(ent, Fighter)
-                        hc.hp -= fc.damage
-                        if ent is player:
-                            mq.put(
-                                "Player attacked")
-                        if hc.hp <= 0:
-                            tar.collides = False
-                            tar.symbol = '~'
-                            tar.color = T.TK_RED
-                            break
-
-            if not attacked:
-                if ent is player:
-                    mq.put("Player moved")
-                # Update the Renderable Component's position by it's Velocity:
-                rend.x = tox
-                rend.y = toy
-                # An example of keeping the sprite inside screen boundaries. Basically,
-                # adjust the position back inside screen boundaries if it tries to go outside:
-                rend.x = max(self.minx, rend.x)
-                rend.y = max(self.miny, rend.y)
-                rend.x = min(self.maxx, rend.x)
-                rend.y = min(self.maxy, rend.y)
-                vel.x = 0
-                vel.y = 0
-
-
-class RenderProcessor(esper.Processor):
-    def __init__(self, screen, player):
-        super().__init__()
-        self.screen = screen
-
-    def process(self):
-        # This will iterate over every Entity that has this Component, and render it:
-        for ent, rend in self.world.get_component(Renderable):
-            if ent is player:
-                continue
-            x = int(rend.x)
-            y = int(rend.y)
-            symbol = rend.symbol
-            # color = rend.color
-
-            self.screen.add_str(x, y, symbol, color=rend.color)  # , color
-
-        rend = self.world.component_for_entity(player, Renderable)
-        self.screen.add_str(rend.x, rend.y, rend.symbol, color=rend.color)
-
-
-class RenderMapProcessor(esper.Processor):
-    def __init__(self, screen):
-        super().__init__()
-        self.screen = screen
-
-    def process(self):
-        for ent, map in self.world.get_component(Map):
-            for j in range(map.y):
-                for i in range(map.x):
-                    self.screen.add_str(i, j, "{}".format(map.mapArr[j][i]))
-
-
-class MoveEnemyProcessor(esper.Processor):
-    def __init__(self):
-        super().__init__()
-
-    def process(self):
-        for ent, (vel, ebe) in self.world.get_components(Velocity, EnemyBehavior):
-            if random.randint(0, 1) == 0:
-                vel.x = random.choice([1, -1])
-            else:
-                vel.y = random.choice([1, -1])
-
-
 ################################
 #  Other functions
 ################################
 
-def can_move(world, obj, vect):
-    ty = world.component_for_entity(obj, Renderable).y + vect[0]
-    tx = world.component_for_entity(obj, Renderable).x + vect[1]
-
-    can_move_ = True
-    for ent, target in world.get_component(Renderable):
-        if target.blocks:
-            if target.x == tx and target.y == ty:
-                can_move_ = False
-    return can_move_
-
-
-def render_messages(window):
-    width = MAP_X
+def render_messages(window, now=None):
     height = SCREEN_Y - MAP_Y
-    bbox = "[bbox={}]".format(width)
-    window.clear_area(0, 0, width, height)
     while not mq.empty():
-        msg = mq.get()
-        mg_history.insert(0, msg)
-        #words = msg.split(' ')
-        #lines = reversed(list(justify(words, MAP_X)))
-    cursor = 0
-    for line in mg_history:
-        if cursor <= height:
-            line = bbox + line #works in bearlib only 
-            
-            cursor += window.add_str(0, cursor, line)
-    window.refresh()
+        messages.add(mq.get(), now)
+    if show_perf:
+        profiler.render(window, MAP_X, height)
+    else:
+        messages.render(window, height, now)
 
 
 def render_messages_old(window):
@@ -222,16 +54,56 @@ MAP_X = 24
 MAP_Y = 16
 SCREEN_Y = 28
 SCREEN_X = 60
+# Frames drawn per second, and seconds between polls when no key is waiting
+FPS = 30
+INPUT_POLL = 0.005
+
+parser = argparse.ArgumentParser(description="Rogpy")
+parser.add_argument('seed', type=int, nargs='?', help="map seed, a new game")
+parser.add_argument('--perf-dump', metavar='FILE',
+                    help="write processor timings here on exit")
+parser.add_argument('--record', metavar='FILE', help="record keys for a replay")
+parser.add_argument('--replay', metavar='FILE', help="play a recorded game back")
+parser.add_argument('--to', type=int, default=0, metavar='TURN',
+                    help="start the replay from its last keyframe before TURN and "
+                         "skip drawing until TURN")
+parser.add_argument('--delay', type=float, default=0.05,
+                    help="seconds between replayed turns once drawing")
+ARGS = parser.parse_args()
+
+SEED = ARGS.seed if ARGS.seed is not None else random.randrange(2 ** 32)
+# Processor timings are written here on exit when given
+PERF_DUMP = ARGS.perf_dump
+# Saved on quit and every AUTOSAVE_TURNS turns, resumed when no seed is given
+SAVE = 'save.sav'
+AUTOSAVE_TURNS = 20
 
 # Messaging
 mq = queue.Queue()
-mg_history = []
+messages = MessageLog(MAP_X)
+
+# Performance overlay, toggled with p
+profiler = Profiler()
+show_perf = False
 
 T = Terminal()
 T.get_term(SCREEN_Y, SCREEN_X)
+# mgr() prints errors instead of raising, so the cleanup after it cannot
+# count on the game having set these
+recorder = autosave = None
 with T.mgr() as stdscreen:
-    map1 = dMap()
-    map1.makeMap(MAP_X,MAP_Y,110,50,60) 
+    saved = None
+    replay = Replay(ARGS.replay) if ARGS.replay else None
+    if replay is not None:
+        frame = replay.seek(ARGS.to)
+        map1, saved, next_id = frame.load()
+        SEED = replay.map_seed
+        ENEMY_SEED = replay.enemy_seed
+    elif ARGS.seed is None and os.path.exists(SAVE):
+        map1, saved, next_id = load_snapshot(SAVE)
+        SEED = map1.seed
+    else:
+        map1 = LevelCache().get(SEED, MAP_X, MAP_Y, 110, 50, 60)
     print(map1.roomList)
     map1.print_map()
     # stdscreen.get_term()
@@ -249,6 +121,9 @@ with T.mgr() as stdscreen:
     # myscreen.idlok(False)
     myscreen.keypad(1)
     T.set_colors()
+    messages.palette = T.FADE
+    # Redraws animated tiles on the map as their frames turn
+    animator = Animator(T.TILES)
     # curses.start_color()
     # curses.noecho()
 
@@ -259,94 +134,155 @@ with T.mgr() as stdscreen:
     # myscreen.border(0)
     myscreen.move(0, 0)
 
-    world = esper.World()
-
-    control_processor = ControlProcessor(0, MAP_Y, 0, MAP_X)
-    world.add_processor(control_processor, priority=102)
-    global player
-    player = world.create_entity()
-    # global player
-    render_processor = RenderProcessor(myscreen, player)
-    world.add_processor(render_processor, priority=99)
-
-    map_renderer = RenderMapProcessor(myscreen)
-    world.add_processor(map_renderer, priority=100)
-
-    enemy_mover = MoveEnemyProcessor()
-    world.add_processor(enemy_mover, priority=101)
-
-    # class TakesDamage:
-    # def __init__(self, hp=10, armorvalue=1.0, fire_res=1.0, ice_res=1.0,
-    # ele_res=1.0, poi_res=1.0):
-    map = world.create_entity()
-    world.add_component(map, Map(map1.size_x, map1.size_y, map1.mapArr))
-    
-    p_pos_x, p_pos_y = map1.get_entry()
-    # p_pos_x, p_pos_y = 0,0
-
-    dam_kwargs = {'hp': 20, 'armorvalue': 1.2, 'fire_res': 1.1, 'ice_res': 1.1,
-                  'ele_res': 1.1, 'poi_res': 1.1}
-    world.add_component(player, TakesDamage(**dam_kwargs))
-    world.add_component(player, Velocity(0, 0))
-    world.add_component(player, Fighter())
-    world.add_component(player, Renderable('@', p_pos_x, p_pos_y, False, True, color=T.TK_GREY))
-
-
-
-    # Create an enemy
-    dam_kwargs = {'hp': 15, 'armorvalue': 1.0, 'fire_res': 1.0, 'ice_res': 1.0,
-                  'ele_res': 1.0, 'poi_res': 1.0}
-    enemy0 = world.create_entity()
-    world.add_component(enemy0, TakesDamage(**dam_kwargs))
-    world.add_component(enemy0, Velocity(0, 0))
-    world.add_component(enemy0, Renderable('g', 1, 1, False, True, color=T.TK_GREEN))
-    # world.add_component(enemy0, EnemyBehavior())
-
-    # Create a tree
-    tree = world.create_entity()
-    world.add_component(tree, Renderable('^', 2, 3, True, False, color=T.TK_WHITE))
-
-    world.process()
-    myscreen.refresh()
-    while True:
-        myscreen.refresh()
-        c = myscreen.getch()
-        moving_to = None
-
-        if c == T.KEY_DOWN:
-            moving_to = [1, 0]
-        if c == T.KEY_UP:
-            moving_to = [-1, 0]
-        if c == T.KEY_RIGHT:
-            moving_to = [0, 1]
-        if c == T.KEY_LEFT:
-            moving_to = [0, -1]
-        if c == T.DOT:
-            moving_to = False
-
-        if moving_to:
-            if world.has_component(player, Velocity):
-                if can_move(world, player, moving_to):
-                    world.component_for_entity(player, Velocity).x = moving_to[1]
-                    world.component_for_entity(player, Velocity).y = moving_to[0]
-                else:
+    if replay is None:
+        ENEMY_SEED = random.randrange(2 ** 32)
+    enemy_rng = random.Random(ENEMY_SEED)
+    # Drawing happens in its own task rather than in world.process()
+    world, player, renderers = build_world(T, myscreen, map1, mq, MAP_X, MAP_Y,
+                                           profiler, render=False, rng=enemy_rng,
+                                           animator=animator)
+    if saved is not None:
+        restore(world, saved, next_id)
+    turn = 0
+    key_index = 0
+
+    if replay is not None:
+        enemy_rng.setstate(frame.rng_state)
+        turn = frame.turn
+        key_index = frame.key_index
+        # Sight is not saved in keyframes, work it out before the first frame
+        world.get_processor(FOVProcessor).process()
+        autosave = None
+    else:
+        if saved is None:
+            world.process()
+        else:
+            # Resume exactly as saved: no turn passes, only sight is worked out
+            world.get_processor(FOVProcessor).process()
+        autosave = Autosaver(SAVE)
+    recorder = None
+    if ARGS.record:
+        recorder = ReplayRecorder(ARGS.record, SEED, ENEMY_SEED)
+        recorder.keyframe(world, map1, enemy_rng, turn)
+
+    def draw(world_changed):
+        now = time.monotonic()
+        if world_changed:
+            for renderer in renderers:
+                before = time.perf_counter()
+                renderer.process()
+                profiler.record(renderer.__class__.__name__,
+                                time.perf_counter() - before)
+        before = time.perf_counter()
+        animated = animator.tick(now)
+        if animated:
+            profiler.record('Animator', time.perf_counter() - before)
+        if world_changed or animated:
+            myscreen.refresh()
+        render_messages(msgw, now)
+
+    async def read_input(keys):
+        """Queue keys from the terminal, or the replay, without blocking the loop.
+
+        While replaying, the terminal is still polled so q stops playback.
+        """
+        global key_index
+        while True:
+            if replay is not None and key_index < len(replay.keys):
+                # Only quitting and the overlay are taken from the keyboard
+                # during playback, other keys would change the replayed game
+                c = myscreen.poll()
+                if c == T.Q or c == T.P:
+                    await keys.put(c)
+                c = replay.keys[key_index]
+                key_index += 1
+            else:
+                c = myscreen.poll()
+                if c is None:
+                    await asyncio.sleep(INPUT_POLL)
                     continue
-        elif moving_to == False:
-            pass
-        
-
-        world.process()
-
-        render_messages(msgw)
-        # msgw.touchwin()
-        # msgw.refresh()
-
-        # if c == curses.KEY_DOWN:
+            await keys.put(c)
+
+    async def simulate(keys):
+        """Play each queued key as a turn, returning when q is pressed."""
+        global turn, show_perf
+        while True:
+            c = await keys.get()
+            if recorder is not None:
+                recorder.key(c)
+            moving_to = None
+
+            if c == T.KEY_DOWN:
+                moving_to = [1, 0]
+            if c == T.KEY_UP:
+                moving_to = [-1, 0]
+            if c == T.KEY_RIGHT:
+                moving_to = [0, 1]
+            if c == T.KEY_LEFT:
+                moving_to = [0, -1]
+            if c == T.DOT:
+                moving_to = False
+
+            if moving_to is None:
+                if c == T.Q:
+                    if autosave is not None:
+                        autosave.submit(world, map1)
+                    return
+                if c == T.P:
+                    show_perf = not show_perf
+                    messages.dirty = True
+                # Not an action, nothing changed and no time passes
+                continue
+            if not player_action(world, player, moving_to):
+                continue
 
-        if c == T.Q:
-            break
-            # else:
-            # break
+            world.process()
+            turn += 1
+            if recorder is not None:
+                recorder.turn(world, map1, enemy_rng, turn)
+            if autosave is not None and turn % AUTOSAVE_TURNS == 0:
+                autosave.submit(world, map1)
+            if replay is not None and turn >= ARGS.to:
+                # Pace playback here, where the turn is played, not read
+                await asyncio.sleep(ARGS.delay)
+            else:
+                # Let input and drawing run between fast-forwarded turns
+                await asyncio.sleep(0)
+
+    async def render(fps):
+        """Draw at a steady rate; a late frame starts the next one at once."""
+        loop = asyncio.get_running_loop()
+        period = 1.0 / fps
+        drawn = None
+        while True:
+            start = loop.time()
+            # A replay skips drawing until the turn it fast-forwards to
+            if replay is None or turn >= ARGS.to:
+                draw(drawn != turn)
+                drawn = turn
+            await asyncio.sleep(max(0.0, period - (loop.time() - start)))
+
+    async def main():
+        # No read-ahead while replaying, so a q typed during playback is
+        # next in line rather than behind a queue of recorded keys
+        keys = asyncio.Queue(1 if replay is not None else 16)
+        tasks = [asyncio.ensure_future(simulate(keys)),
+                 asyncio.ensure_future(read_input(keys)),
+                 asyncio.ensure_future(render(FPS))]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+
+    asyncio.run(main())
+
+if recorder is not None:
+    recorder.close()
+if autosave is not None:
+    autosave.close()
+if PERF_DUMP:
+    profiler.dump(PERF_DUMP)
 
 ##################
 # TODO-list
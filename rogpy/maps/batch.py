@@ -0,0 +1,114 @@
+# Generate many seeded dMap layouts in parallel and report layout statistics
+#
+#   python maps/batch.py 10000 --size 50x32 --fail 110 --b1 50 --mrooms 60 \
+#       --out samples.bin
+import argparse
+import os
+import signal
+import struct
+import time
+from multiprocessing import Pool
+
+try:
+    from maps.mapcreation import dMap
+    from maps.tilegrid import FLOOR, DOORS
+    from maps.levelcache import pack_level
+except ImportError:
+    from mapcreation import dMap
+    from tilegrid import FLOOR, DOORS
+    from levelcache import pack_level
+
+# seed, length of the pack_level payload that follows
+RECORD = struct.Struct('<II')
+
+
+class GenerationTimeout(Exception):
+    pass
+
+
+def _timeout(signum, frame):
+    raise GenerationTimeout()
+
+
+def sample(job):
+    """Worker: generate one map, return (seed, stats, packed level or None).
+
+    Where SIGALRM exists a map taking longer than timeout seconds is
+    abandoned and reported as a failure.
+    """
+    seed, xsize, ysize, fail, b1, mrooms, timeout = job
+    dmap = dMap(seed=seed)
+    alarm = timeout and hasattr(signal, 'SIGALRM')
+    if alarm:
+        signal.signal(signal.SIGALRM, _timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        dmap.makeMap(xsize, ysize, fail, b1, mrooms)
+    except Exception:
+        return seed, None, None
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    rooms = sum(1 for ll, ww, x, y in dmap.roomList if ll > 1 and ww > 1)
+    stats = {'rooms': rooms,
+             'corridors': len(dmap.roomList) - rooms,
+             'floor': dmap.mapArr.count(FLOOR) / float(xsize * ysize),
+             'doors': dmap.mapArr.count(*DOORS)}
+    return seed, stats, pack_level(dmap)
+
+
+def run(count, xsize, ysize, fail, b1, mrooms, seed=0, workers=None, out=None,
+        timeout=1.0):
+    """Generate count maps from seed upward; returns (stats list, failures, seconds)."""
+    jobs = ((s, xsize, ysize, fail, b1, mrooms, timeout)
+            for s in range(seed, seed + count))
+    results = []
+    failures = 0
+    f = open(out, 'wb') if out else None
+    start = time.perf_counter()
+    try:
+        with Pool(workers) as pool:
+            for s, stats, packed in pool.imap_unordered(sample, jobs, chunksize=64):
+                # A layout that never grew past its first room counts as failed
+                if stats is None or stats['rooms'] + stats['corridors'] < 2:
+                    failures += 1
+                    continue
+                results.append(stats)
+                if f is not None:
+                    f.write(RECORD.pack(s, len(packed)))
+                    f.write(packed)
+    finally:
+        if f is not None:
+            f.close()
+    return results, failures, time.perf_counter() - start
+
+
+def mean(results, key):
+    return sum(r[key] for r in results) / len(results) if results else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch-generate dMap layouts")
+    parser.add_argument('count', type=int, help="number of maps")
+    parser.add_argument('--size', default='50x32', help="WIDTHxHEIGHT")
+    parser.add_argument('--fail', type=int, default=110)
+    parser.add_argument('--b1', type=int, default=50)
+    parser.add_argument('--mrooms', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0, help="first seed")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', help="stream the generated levels to this file")
+    parser.add_argument('--timeout', type=float, default=1.0,
+                        help="seconds before a map counts as failed, 0 to wait forever")
+    args = parser.parse_args()
+
+    xsize, ysize = (int(v) for v in args.size.split('x'))
+    results, failures, secs = run(args.count, xsize, ysize, args.fail, args.b1,
+                                  args.mrooms, args.seed, args.workers, args.out,
+                                  args.timeout)
+    print("{} maps in {:.2f}s, {:.1f} maps/sec".format(args.count, secs,
+                                                       args.count / secs))
+    print("failure rate  {:.2%}".format(failures / float(args.count)))
+    print("rooms         {:.2f}".format(mean(results, 'rooms')))
+    print("corridors     {:.2f}".format(mean(results, 'corridors')))
+    print("floor cover   {:.2%}".format(mean(results, 'floor')))
+    print("doors         {:.2f}".format(mean(results, 'doors')))
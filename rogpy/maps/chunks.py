@@ -0,0 +1,142 @@
+# Unbounded world split into dMap chunks, generated on demand and paged to disk
+import os
+from collections import OrderedDict
+from random import Random
+
+try:
+    from maps.mapcreation import dMap
+    from maps.tilegrid import TileGrid, FLOOR, ROCK
+    from maps.levelcache import save_level, load_level
+except ImportError:
+    from mapcreation import dMap
+    from tilegrid import TileGrid, FLOOR, ROCK
+    from levelcache import save_level, load_level
+
+
+class ChunkedMap:
+    """World of size x size chunks addressed by global (x, y) tiles.
+
+    A chunk is generated with dMap's rooms and corridors the first time it
+    is touched, from a seed derived from the world seed and its chunk
+    coordinates, and a passage is cut from each of its edges so
+    neighbouring chunks connect. Loaded chunks are kept in LRU order;
+    once their tiles exceed budget bytes the least recently used are
+    written to directory and dropped, to be loaded again when needed.
+    """
+    def __init__(self, seed, size=32, fail=110, b1=50, mrooms=60,
+                 budget=4 * 1024 * 1024, directory='chunks'):
+        self.seed = seed
+        self.size = size
+        self.params = (fail, b1, mrooms)
+        self.budget = budget
+        self.directory = os.path.join(directory, str(seed))
+        self.chunks = OrderedDict()
+        self.modified = set()
+        self.on_disk = set()
+
+    def chunk_seed(self, cx, cy):
+        return ((self.seed * 73856093) ^ (cx * 19349663) ^ (cy * 83492791)) & 0xFFFFFFFF
+
+    def path(self, cx, cy):
+        return os.path.join(self.directory, "{}_{}.lvl".format(cx, cy))
+
+    def chunk(self, cx, cy):
+        """The dMap for chunk (cx, cy), loading or generating it if needed."""
+        key = (cx, cy)
+        dmap = self.chunks.get(key)
+        if dmap is not None:
+            self.chunks.move_to_end(key)
+            return dmap
+        if key in self.on_disk:
+            dmap = load_level(self.path(cx, cy), self.chunk_seed(cx, cy))
+        else:
+            dmap = self.generate(cx, cy)
+        self.chunks[key] = dmap
+        self.evict()
+        return dmap
+
+    def generate(self, cx, cy):
+        dmap = dMap(seed=self.chunk_seed(cx, cy))
+        dmap.makeMap(self.size, self.size, *self.params)
+        self.link_edges(dmap, cx, cy)
+        return dmap
+
+    def gate(self, edge):
+        """Offset along a chunk edge where the passage to the neighbour is cut.
+
+        Derived from the edge alone, so both chunks sharing it agree.
+        """
+        rng = Random("{} {} {} {}".format(self.seed, *edge))
+        return rng.randrange(2, self.size - 2)
+
+    def link_edges(self, dmap, cx, cy):
+        """Carve floor inward from each edge's gate until it meets open floor."""
+        last = self.size - 1
+        grid = dmap.mapArr
+        # Edges are keyed (0, cx, cy) for a top edge, (1, cx, cy) for a left one
+        edges = [((0, cx, cy), (0, 1)), ((0, cx, cy + 1), (0, -1)),
+                 ((1, cx, cy), (1, 0)), ((1, cx + 1, cy), (-1, 0))]
+        for edge, (dx, dy) in edges:
+            g = self.gate(edge)
+            if dx == 0:
+                x, y = g, (0 if dy == 1 else last)
+            else:
+                x, y = (0 if dx == 1 else last), g
+            for _ in range(self.size // 2):
+                grid[y][x] = FLOOR
+                x += dx
+                y += dy
+                if grid[y][x] == FLOOR:
+                    break
+
+    def evict(self):
+        cost = self.size * self.size
+        while len(self.chunks) > 1 and len(self.chunks) * cost > self.budget:
+            key, dmap = self.chunks.popitem(last=False)
+            if key in self.modified or key not in self.on_disk:
+                os.makedirs(self.directory, exist_ok=True)
+                save_level(dmap, self.path(*key))
+                self.on_disk.add(key)
+                self.modified.discard(key)
+
+    def locate(self, x, y):
+        cx, lx = divmod(x, self.size)
+        cy, ly = divmod(y, self.size)
+        return cx, cy, lx, ly
+
+    def tile(self, x, y):
+        cx, cy, lx, ly = self.locate(x, y)
+        return self.chunk(cx, cy).mapArr[ly][lx]
+
+    def set_tile(self, x, y, value):
+        cx, cy, lx, ly = self.locate(x, y)
+        self.chunk(cx, cy).mapArr[ly][lx] = value
+        self.modified.add((cx, cy))
+
+    def around(self, x, y, radius=1):
+        """Make sure the chunks within radius chunks of tile (x, y) are loaded."""
+        cx, cy, lx, ly = self.locate(x, y)
+        for j in range(cy - radius, cy + radius + 1):
+            for i in range(cx - radius, cx + radius + 1):
+                self.chunk(i, j)
+
+    def viewport(self, x, y, w, h):
+        """TileGrid copy of the w x h area whose top left tile is (x, y)."""
+        view = TileGrid(w, h, ROCK)
+        for j in range(h):
+            i = 0
+            while i < w:
+                cx, cy, lx, ly = self.locate(x + i, y + j)
+                n = min(self.size - lx, w - i)
+                view[j][i:i + n] = self.chunk(cx, cy).mapArr[ly][lx:lx + n]
+                i += n
+        return view
+
+    def flush(self):
+        """Write every modified or never-saved loaded chunk to disk."""
+        os.makedirs(self.directory, exist_ok=True)
+        for key, dmap in self.chunks.items():
+            if key in self.modified or key not in self.on_disk:
+                save_level(dmap, self.path(*key))
+                self.on_disk.add(key)
+        self.modified.clear()
@@ -0,0 +1,90 @@
+# Dijkstra maps: distance fields over a TileGrid shared by every monster
+import heapq
+from array import array
+from collections import deque
+
+try:
+    from maps.tilegrid import WALKABLE
+except ImportError:
+    from tilegrid import WALKABLE
+
+UNREACHED = 2 ** 30
+# Per tile code: 1 if monsters may path through it
+WALKABLE_TABLE = bytes(1 if code in WALKABLE else 0 for code in range(256))
+
+
+def walkable_mask(grid):
+    """One byte per cell, 1 where walkable, translated in a single pass."""
+    return grid.cells.translate(WALKABLE_TABLE)
+
+
+def distance_map(grid, goals, mask=None):
+    """Steps from every cell to the nearest goal (x, y), by 4-way moves.
+
+    Returns a flat array('i') indexed y * width + x, UNREACHED where no
+    goal can be reached.
+    """
+    if mask is None:
+        mask = walkable_mask(grid)
+    w = grid.width
+    size = w * grid.height
+    dist = array('i', [UNREACHED]) * size
+    frontier = deque()
+    for x, y in goals:
+        i = y * w + x
+        dist[i] = 0
+        frontier.append(i)
+    while frontier:
+        i = frontier.popleft()
+        d = dist[i] + 1
+        x = i % w
+        for n in (i - w, i + w, i - 1 if x > 0 else -1, i + 1 if x < w - 1 else -1):
+            if 0 <= n < size and mask[n] and dist[n] > d:
+                dist[n] = d
+                frontier.append(n)
+    return dist
+
+
+def flee_map(grid, dist, mask=None, factor=-1.2):
+    """Field that leads away from the goals of dist without cornering.
+
+    Scales the reachable distances by a negative factor and rescans, so
+    rolling downhill heads for far open areas rather than dead ends.
+    """
+    if mask is None:
+        mask = walkable_mask(grid)
+    w = grid.width
+    size = w * grid.height
+    flee = array('i', [UNREACHED]) * size
+    heap = []
+    for i in range(size):
+        if dist[i] != UNREACHED:
+            flee[i] = int(dist[i] * factor)
+            heap.append((flee[i], i))
+    heapq.heapify(heap)
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > flee[i]:
+            continue
+        d += 1
+        x = i % w
+        for n in (i - w, i + w, i - 1 if x > 0 else -1, i + 1 if x < w - 1 else -1):
+            if 0 <= n < size and mask[n] and flee[n] > d:
+                flee[n] = d
+                heapq.heappush(heap, (d, n))
+    return flee
+
+
+def downhill(field, width, height, x, y):
+    """(dx, dy) of the 4-way neighbour with the lowest value, (0, 0) if none is lower."""
+    best = field[y * width + x]
+    step = (0, 0)
+    for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+        nx = x + dx
+        ny = y + dy
+        if 0 <= nx < width and 0 <= ny < height:
+            v = field[ny * width + nx]
+            if v < best:
+                best = v
+                step = (dx, dy)
+    return step
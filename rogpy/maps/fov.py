@@ -0,0 +1,63 @@
+# Recursive shadowcasting field of view over a TileGrid
+try:
+    from maps.tilegrid import OPAQUE
+except ImportError:
+    from tilegrid import OPAQUE
+
+# Per tile code: 1 if it blocks sight
+OPAQUE_TABLE = bytes(1 if code in OPAQUE else 0 for code in range(256))
+
+# Transforms from octant-local (dx, dy) to map offsets
+OCTANTS = [(1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)]
+
+
+def compute_fov(grid, x, y, radius):
+    """Set of (x, y) cells visible from (x, y) within radius on grid."""
+    visible = {(x, y)}
+    for xx, xy, yx, yy in OCTANTS:
+        _cast_light(grid, x, y, 1, 1.0, 0.0, radius, xx, xy, yx, yy, visible)
+    return visible
+
+
+def _cast_light(grid, cx, cy, row, start, end, radius, xx, xy, yx, yy, visible):
+    if start < end:
+        return
+    cells = grid.cells
+    w = grid.width
+    h = grid.height
+    radius_sq = radius * radius
+    new_start = start
+    for j in range(row, radius + 1):
+        dx = -j - 1
+        dy = -j
+        blocked = False
+        while dx <= 0:
+            dx += 1
+            mx = cx + dx * xx + dy * xy
+            my = cy + dx * yx + dy * yy
+            l_slope = (dx - 0.5) / (dy + 0.5)
+            r_slope = (dx + 0.5) / (dy - 0.5)
+            if start < r_slope:
+                continue
+            elif end > l_slope:
+                break
+            if 0 <= mx < w and 0 <= my < h:
+                if dx * dx + dy * dy < radius_sq:
+                    visible.add((mx, my))
+                opaque = OPAQUE_TABLE[cells[my * w + mx]]
+            else:
+                opaque = 1
+            if blocked:
+                if opaque:
+                    new_start = r_slope
+                else:
+                    blocked = False
+                    start = new_start
+            elif opaque and j < radius:
+                blocked = True
+                _cast_light(grid, cx, cy, j + 1, start, l_slope, radius,
+                            xx, xy, yx, yy, visible)
+                new_start = r_slope
+        if blocked:
+            break
@@ -0,0 +1,100 @@
+# Binary save/load of generated dMap levels, keyed by seed and parameters
+import mmap
+import os
+import struct
+
+try:
+    from maps.mapcreation import dMap, GENERATOR_VERSION
+    from maps.tilegrid import TileGrid
+except ImportError:
+    from mapcreation import dMap, GENERATOR_VERSION
+    from tilegrid import TileGrid
+
+# magic, version, xsize, ysize, number of rooms, number of corridors
+HEADER = struct.Struct('<4sHHHII')
+MAGIC = b'RGLV'
+VERSION = 1
+ENTRY = struct.Struct('<4i')
+
+
+def pack_level(dmap):
+    """dmap's tile grid, roomList and cList as bytes.
+
+    Layout: HEADER, one ENTRY per room, one ENTRY per corridor, then the
+    row-major tile bytes.
+    """
+    parts = [HEADER.pack(MAGIC, VERSION, dmap.size_x, dmap.size_y,
+                         len(dmap.roomList), len(dmap.cList))]
+    parts.extend(ENTRY.pack(*room) for room in dmap.roomList)
+    parts.extend(ENTRY.pack(*c) for c in dmap.cList)
+    parts.append(bytes(dmap.mapArr.cells))
+    return b''.join(parts)
+
+
+def save_level(dmap, path):
+    """Write pack_level(dmap) to path."""
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(pack_level(dmap))
+    os.replace(tmp, path)
+
+
+def unpack_level(buf, seed=None):
+    """Rebuild the dMap from pack_level bytes (or any buffer holding them)."""
+    magic, version, xsize, ysize, nrooms, ncorr = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a level")
+    offset = HEADER.size
+    rooms = [list(e) for e in ENTRY.iter_unpack(
+        buf[offset:offset + nrooms * ENTRY.size])]
+    offset += nrooms * ENTRY.size
+    corridors = [list(e) for e in ENTRY.iter_unpack(
+        buf[offset:offset + ncorr * ENTRY.size])]
+    offset += ncorr * ENTRY.size
+    grid = TileGrid(xsize, ysize)
+    grid.cells[:] = buf[offset:offset + xsize * ysize]
+    dmap = dMap(seed=seed)
+    dmap.size_x = xsize
+    dmap.size_y = ysize
+    dmap.mapArr = grid
+    dmap.roomList = rooms
+    dmap.cList = corridors
+    return dmap
+
+
+def load_level(path, seed=None):
+    """Memory-map a file written by save_level and rebuild the dMap."""
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                return unpack_level(mm, seed)
+            except ValueError:
+                raise ValueError("{} is not a level file".format(path))
+
+
+class LevelCache:
+    """Directory of generated levels, so a seed is only generated once.
+
+    File names include GENERATOR_VERSION, so levels from an older
+    generator are made again rather than served for the same seed.
+    """
+    def __init__(self, directory='levels'):
+        self.directory = directory
+
+    def path(self, seed, xsize, ysize, fail, b1, mrooms):
+        name = "{}-{}x{}-{}-{}-{}.g{}.lvl".format(seed, xsize, ysize, fail, b1, mrooms,
+                                                  GENERATOR_VERSION)
+        return os.path.join(self.directory, name)
+
+    def get(self, seed, xsize, ysize, fail, b1, mrooms):
+        """Load the level for these parameters, generating and saving it on a miss."""
+        path = self.path(seed, xsize, ysize, fail, b1, mrooms)
+        if os.path.exists(path):
+            return load_level(path, seed)
+        dmap = dMap(seed=seed)
+        dmap.makeMap(xsize, ysize, fail, b1, mrooms)
+        # Continue from the same RNG state a later load_level will have
+        dmap.rng.seed(seed)
+        os.makedirs(self.directory, exist_ok=True)
+        save_level(dmap, path)
+        return dmap
@@ -1,9 +1,20 @@
 # Class to produce random map layouts
-from random import *
+from random import Random
 from math import *
+
+try:
+    from maps.tilegrid import TileGrid
+except ImportError:
+    from tilegrid import TileGrid
+
+# Bumped whenever a seed starts producing a different layout
+GENERATOR_VERSION = 2
  
 class dMap:
-    def __init__(self):
+    def __init__(self,seed=None,rng=None):
+        """Layouts are driven by rng, or a Random(seed) when none is given"""
+        self.seed=seed
+        self.rng=rng if rng is not None else Random(seed)
         self.roomList=[]
         self.cList=[]
  
@@ -14,23 +25,29 @@ class dMap:
         self.size_x = xsize
         self.size_y = ysize
         # initialize map to all walls
-        self.mapArr=[] 
-        for y in range(ysize):
-            tmp = []
-            for x in range(xsize):
-                tmp.append(1)
-            self.mapArr.append( tmp )
+        self.mapArr=TileGrid(xsize,ysize,1)
+        # Per row, a bitmask of the cells that are no longer solid rock
+        self.occupied=[0]*ysize
+        # Per room, its wall cells an exit can still be cut through, and the
+        # slot of each in that list; per wall cell, the rooms that use it
+        self.exits=[]
+        self.exitSlots=[]
+        self.exitCells={}
  
         w,l,t=self.makeRoom()
         while len(self.roomList)==0:
-            y=randrange(ysize-1-l)+1
-            x=randrange(xsize-1-w)+1
+            y=self.rng.randrange(ysize-1-l)+1
+            x=self.rng.randrange(xsize-1-w)+1
             p=self.placeRoom(l,w,x,y,xsize,ysize,6,0)
         failed=0
         while failed<fail: #The lower the value that failed< , the smaller the dungeon
-            chooseRoom=randrange(len(self.roomList))
-            ex,ey,ex2,ey2,et=self.makeExit(chooseRoom)
-            feature=randrange(100)
+            chooseRoom=self.rng.randrange(len(self.roomList))
+            exit=self.makeExit(chooseRoom)
+            if exit is None: #Room is walled in, try another
+                failed+=1
+                continue
+            ex,ey,ex2,ey2,et=exit
+            feature=self.rng.randrange(100)
             if feature<b1: #Begin feature choosing (more features to be added here)
                 w,l,t=self.makeCorridor()
             else:
@@ -40,7 +57,7 @@ class dMap:
                 failed+=1
             elif roomDone==2: #Possiblilty of linking rooms
                 if self.mapArr[ey2][ex2]==0:
-                    if randrange(100)<7:
+                    if self.rng.randrange(100)<7:
                         self.makePortal(ex,ey)
                     failed+=1
             else: #Otherwise, link up the 2 rooms
@@ -57,14 +74,14 @@ class dMap:
     def makeRoom(self):
         """Randomly produce room size"""
         rtype=5
-        rwide=randrange(8)+3
-        rlong=randrange(8)+3
+        rwide=self.rng.randrange(8)+3
+        rlong=self.rng.randrange(8)+3
         return rwide,rlong,rtype
  
     def makeCorridor(self):
         """Randomly produce corridor length and heading"""
-        clength=randrange(18)+3
-        heading=randrange(4)
+        clength=self.rng.randrange(18)+3
+        heading=self.rng.randrange(4)
         if heading==0: #North
             wd=1
             lg=-clength
@@ -93,10 +110,10 @@ class dMap:
         #Make offset if type is room
         if rty==5:
             if ext==0 or ext==2:
-                offset=randrange(ww)
+                offset=self.rng.randrange(ww)
                 xpos-=offset
             else:
-                offset=randrange(ll)
+                offset=self.rng.randrange(ll)
                 ypos-=offset
         #Then check if there is space
         canPlace=1
@@ -107,65 +124,90 @@ class dMap:
             canPlace=0
             return canPlace
         else:
+            mask=((1<<ww)-1)<<xpos
             for j in range(ll):
-                for k in range(ww):
-                    if self.mapArr[(ypos)+j][(xpos)+k]!=1:
-                        canPlace=2
+                if self.occupied[ypos+j]&mask:
+                    canPlace=2
+                    break
         #If there is space, add to list of rooms
         if canPlace==1:
             temp=[ll,ww,xpos,ypos]
             self.roomList.append(temp)
-            for j in range(ll+2): #Then build walls
-                for k in range(ww+2):
-                    self.mapArr[(ypos-1)+j][(xpos-1)+k]=2
-            for j in range(ll): #Then build floor
-                for k in range(ww):
-                    self.mapArr[ypos+j][xpos+k]=0
+            self.mapArr.fill_rect(xpos-1,ypos-1,ww+2,ll+2,2) #Then build walls
+            self.mapArr.fill_rect(xpos,ypos,ww,ll,0) #Then build floor
+            mask=((1<<(ww+2))-1)<<(xpos-1)
+            for j in range(ypos-1,ypos+ll+1):
+                self.occupied[j]|=mask
+            for k in range(xpos-1,xpos+ww+1): #Walls may have covered other rooms' doors
+                self.updateExits(k,ypos-1)
+                self.updateExits(k,ypos+ll)
+            for j in range(ypos,ypos+ll):
+                self.updateExits(xpos-1,j)
+                self.updateExits(xpos+ww,j)
+            self.addRoomExits(len(self.roomList)-1)
         return canPlace #Return whether placed is true/false
+
+    def addRoomExits(self,rn):
+        """Register every wall cell of a new room as an exit candidate"""
+        ll,ww,x,y=self.roomList[rn]
+        self.exits.append([])
+        self.exitSlots.append({})
+        cands=[]
+        for rx in range(x,x+ww):
+            cands.append((rx,y-1,rx,y-2,0)) #North wall
+            cands.append((rx,y+ll,rx,y+ll+1,2)) #South wall
+        for ry in range(y,y+ll):
+            cands.append((x+ww,ry,x+ww+1,ry,1)) #East wall
+            cands.append((x-1,ry,x-2,ry,3)) #West wall
+        for c in cands:
+            self.exitCells.setdefault((c[0],c[1]),[]).append((rn,c))
+            self.addExit(rn,c)
+
+    def addExit(self,rn,c):
+        slots=self.exitSlots[rn]
+        if c not in slots:
+            slots[c]=len(self.exits[rn])
+            self.exits[rn].append(c)
+
+    def dropExit(self,rn,c):
+        slots=self.exitSlots[rn]
+        i=slots.pop(c,None)
+        if i is None:
+            return
+        exits=self.exits[rn]
+        last=exits.pop()
+        if i<len(exits):
+            exits[i]=last
+            slots[last]=i
+
+    def updateExits(self,x,y):
+        """Keep the cell at x,y a candidate for its rooms only while it is a wall"""
+        for rn,c in self.exitCells.get((x,y),()):
+            if self.mapArr[y][x]==2:
+                self.addExit(rn,c)
+            else:
+                self.dropExit(rn,c)
  
     def makeExit(self,rn):
-        """Pick random wall and random point along that wall"""
-        room=self.roomList[rn]
-        while True:
-            rw=randrange(4)
-            if rw==0: #North wall
-                rx=randrange(room[1])+room[2]
-                ry=room[3]-1
-                rx2=rx
-                ry2=ry-1
-            elif rw==1: #East wall
-                ry=randrange(room[0])+room[3]
-                rx=room[2]+room[1]
-                rx2=rx+1
-                ry2=ry
-            elif rw==2: #South wall
-                rx=randrange(room[1])+room[2]
-                ry=room[3]+room[0]
-                rx2=rx
-                ry2=ry+1
-            elif rw==3: #West wall
-                ry=randrange(room[0])+room[3]
-                rx=room[2]-1
-                rx2=rx-1
-                ry2=ry
-            if self.mapArr[ry][rx]==2: #If space is a wall, exit
-                break
-        return rx,ry,rx2,ry2,rw
+        """Pick a random wall cell of the room still usable as an exit, or None"""
+        exits=self.exits[rn]
+        if not exits:
+            return None
+        return exits[self.rng.randrange(len(exits))]
  
     def makePortal(self,px,py):
         """Create doors in walls"""
-        ptype=randrange(100)
+        self.occupied[py]|=1<<px
+        ptype=self.rng.randrange(100)
         if ptype>90: #Secret door
             self.mapArr[py][px]=5
-            return
         elif ptype>75: #Closed door
             self.mapArr[py][px]=4
-            return
         elif ptype>40: #Open door
             self.mapArr[py][px]=3
-            return
         else: #Hole in the wall
             self.mapArr[py][px]=0
+        self.updateExits(px,py)
  
     def joinCorridor(self,cno,xp,yp,ed,psb):
         """Check corridor endpoint and make an exit if it links to another room"""
@@ -219,7 +261,7 @@ class dMap:
                 checkExit.append(coords)
         for xxx,yyy,xxx1,yyy1 in checkExit: #Loop through possible exits
             if self.mapArr[yyy][xxx]==0: #If joins to a room
-                if randrange(100)<psb: #Possibility of linking rooms
+                if self.rng.randrange(100)<psb: #Possibility of linking rooms
                     self.makePortal(xxx1,yyy1)
     
     def finalJoins(self):
@@ -230,11 +272,11 @@ class dMap:
     def get_entry(self):
         test = False
         while test == False:
-            room = choice(self.roomList)
+            room = self.rng.choice(self.roomList)
             height, width, startx, starty = room
             print (room)
-            x = randrange(startx, startx + width)
-            y = randrange(starty, starty + height)
+            x = self.rng.randrange(startx, startx + width)
+            y = self.rng.randrange(starty, starty + height)
             # test = self.test_empty(x, y)
             test = True
         #self.mapArr[y][x] = 6
@@ -0,0 +1,97 @@
+# Generates upcoming dungeon levels in worker processes ahead of the player
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    from maps.mapcreation import dMap
+    from maps.tilegrid import TileGrid
+except ImportError:
+    from mapcreation import dMap
+    from tilegrid import TileGrid
+
+
+def _generate(shm_name, seed, xsize, ysize, fail, b1, mrooms):
+    """Worker: build a level and write its tiles into the named shared block."""
+    dmap = dMap(seed=seed)
+    dmap.makeMap(xsize, ysize, fail, b1, mrooms)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        shm.buf[:xsize * ysize] = dmap.mapArr.cells
+    finally:
+        shm.close()
+    return dmap.roomList, dmap.cList
+
+
+class LevelPipeline:
+    """Keeps the next ahead floors generating in a process pool.
+
+    Each pending floor gets a shared memory block sized for its tiles; the
+    worker fills it and only the room and corridor lists travel back
+    through the pool. get() waits for a floor if it is still running and
+    generates in-process if it was never queued.
+
+    The pool may re-import the main module in its workers on platforms
+    that spawn processes, so the entry script must guard its game loop
+    with if __name__ == "__main__".
+    """
+    def __init__(self, seed, xsize, ysize, fail=110, b1=50, mrooms=60,
+                 ahead=2, workers=None):
+        self.seed = seed
+        self.xsize = xsize
+        self.ysize = ysize
+        self.params = (fail, b1, mrooms)
+        self.ahead = ahead
+        self.depth = 0
+        self.pending = {}
+        self.executor = ProcessPoolExecutor(max_workers=workers or max(1, ahead))
+
+    def level_seed(self, depth):
+        return (self.seed * 1000003 + depth) & 0xFFFFFFFF
+
+    def prefetch(self):
+        """Queue every floor up to ahead below the current one."""
+        for depth in range(self.depth + 1, self.depth + self.ahead + 1):
+            if depth not in self.pending:
+                shm = shared_memory.SharedMemory(create=True,
+                                                 size=self.xsize * self.ysize)
+                future = self.executor.submit(_generate, shm.name,
+                                              self.level_seed(depth),
+                                              self.xsize, self.ysize, *self.params)
+                self.pending[depth] = (future, shm)
+
+    def get(self, depth):
+        """The dMap for depth, from the pool if it was prefetched."""
+        seed = self.level_seed(depth)
+        dmap = dMap(seed=seed)
+        if depth not in self.pending:
+            dmap.makeMap(self.xsize, self.ysize, *self.params)
+            # Same RNG state as a level handed back by the pool
+            dmap.rng.seed(seed)
+            return dmap
+        future, shm = self.pending.pop(depth)
+        try:
+            dmap.roomList, dmap.cList = future.result()
+            dmap.size_x = self.xsize
+            dmap.size_y = self.ysize
+            dmap.mapArr = TileGrid(self.xsize, self.ysize)
+            dmap.mapArr.cells[:] = shm.buf[:self.xsize * self.ysize]
+        finally:
+            shm.close()
+            shm.unlink()
+        return dmap
+
+    def descend(self):
+        """Move one floor down, returning its level and queueing the next ones."""
+        self.depth += 1
+        dmap = self.get(self.depth)
+        self.prefetch()
+        return dmap
+
+    def close(self):
+        for future, shm in self.pending.values():
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        for future, shm in self.pending.values():
+            shm.close()
+            shm.unlink()
+        self.pending.clear()
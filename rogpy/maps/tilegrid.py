@@ -0,0 +1,71 @@
+# Compact tile storage shared by the map generator and the Map component
+
+# Tile codes written by dMap
+FLOOR = 0
+ROCK = 1
+WALL = 2
+OPEN_DOOR = 3
+CLOSED_DOOR = 4
+SECRET_DOOR = 5
+DOORS = (OPEN_DOOR, CLOSED_DOOR, SECRET_DOOR)
+OPAQUE = (ROCK, WALL, CLOSED_DOOR, SECRET_DOOR)
+WALKABLE = (FLOOR, OPEN_DOOR, CLOSED_DOOR)
+
+
+class TileGrid:
+    """Row-major grid of uint8 tile codes held in one bytearray.
+
+    Rows are memoryview slices of the same buffer, so grid[y][x] reads and
+    writes work like the old list of lists while every cell costs one byte.
+    """
+    def __init__(self, width, height, fill=ROCK):
+        self.width = width
+        self.height = height
+        self.cells = bytearray([fill]) * (width * height)
+        self._make_rows()
+
+    def _make_rows(self):
+        view = memoryview(self.cells)
+        w = self.width
+        self.rows = [view[y * w:(y + 1) * w] for y in range(self.height)]
+
+    def __getitem__(self, y):
+        return self.rows[y]
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getstate__(self):
+        return {'width': self.width, 'height': self.height, 'cells': bytes(self.cells)}
+
+    def __setstate__(self, state):
+        self.width = state['width']
+        self.height = state['height']
+        self.cells = bytearray(state['cells'])
+        self._make_rows()
+
+    def fill_rect(self, x, y, w, h, value):
+        """Set every cell of the w*h rectangle at (x, y) to value."""
+        run = bytes([value]) * w
+        for j in range(y, y + h):
+            start = j * self.width + x
+            self.cells[start:start + w] = run
+
+    def count(self, *values):
+        """Number of cells holding any of the given tile codes."""
+        return sum(self.cells.count(v) for v in values)
+
+    def find(self, *values):
+        """List of (x, y) for every cell holding any of the given tile codes."""
+        found = []
+        w = self.width
+        for v in values:
+            needle = bytes([v])
+            i = self.cells.find(needle)
+            while i != -1:
+                found.append((i % w, i // w))
+                i = self.cells.find(needle, i + 1)
+        return found
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Headless soak runs of the game world driven by a bot instead of the keyboard.
+#
+#   python sim.py 100000 --bot explore --enemies 20 --render-every 1000
+#   python sim.py 100000 --profile        also print per-processor timings
+
+import argparse
+import queue
+import random
+import time
+
+from maps.mapcreation import dMap
+from maps.tilegrid import FLOOR
+from maps.dijkstra import walkable_mask, distance_map, downhill
+from UI.term import Terminal
+from UI.messages import MessageLog
+from ecs.components import Renderable, FieldOfView, TakesDamage, Map
+from ecs.profiling import LatencyHistogram, Profiler
+from ecs.spawn import build_world, spawn_enemy, player_action
+
+SEED = 1234
+MOVES = [[1, 0], [-1, 0], [0, 1], [0, -1]]
+
+
+################################
+#  Bot policies
+################################
+# A policy is called as policy(world, player, rng) once per turn and returns
+# a [dy, dx] move or False to wait, the same as a key press in game.py.
+
+def random_bot(world, player, rng):
+    return rng.choice(MOVES)
+
+
+def toward(world, player, rng, goals):
+    """Move one step down the distance field to the nearest of goals."""
+    for ent, map in world.get_component(Map):
+        break
+    rend = world.component_for_entity(player, Renderable)
+    if goals:
+        field = distance_map(map.mapArr, goals, walkable_mask(map.mapArr))
+        dx, dy = downhill(field, map.x, map.y, rend.x, rend.y)
+        if dx or dy:
+            return [dy, dx]
+    return random_bot(world, player, rng)
+
+
+def explore_bot(world, player, rng):
+    """Walk to the nearest floor the player has not seen yet."""
+    for ent, map in world.get_component(Map):
+        break
+    fov = world.component_for_entity(player, FieldOfView)
+    goals = [(x, y) for x, y in map.mapArr.find(FLOOR)
+             if not fov.is_explored(x, y)]
+    return toward(world, player, rng, goals)
+
+
+def hunt_bot(world, player, rng):
+    """Walk to the nearest living monster and attack it."""
+    goals = [(rend.x, rend.y)
+             for ent, (rend, hp) in world.get_components(Renderable, TakesDamage)
+             if ent != player and hp.hp > 0]
+    return toward(world, player, rng, goals)
+
+
+BOTS = {'random': random_bot, 'explore': explore_bot, 'hunt': hunt_bot}
+
+
+################################
+#  Simulation
+################################
+def simulate(turns, policy, seed=SEED, size=(24, 16), enemies=0,
+             render_every=0, profiler=None):
+    """Play turns turns with policy, returning (seconds, turn, bot).
+
+    seconds is the whole run; turn is a LatencyHistogram of each turn's
+    world pass, messages and drawing, and bot one of the policy's time
+    picking the move, kept apart so a slow bot does not pass for a slow
+    world. A blocked move is spent waiting so every turn runs the world
+    once. The screen is only drawn every render_every turns, never when 0.
+    """
+    xsize, ysize = size
+    term = Terminal('headless')
+    term.get_term(ysize, xsize)
+    term.set_colors()
+    screen = term.newwin(xsize, ysize, 0, 0)
+
+    dmap = dMap(seed=seed)
+    dmap.makeMap(xsize, ysize, 110, 50, 60)
+    mq = queue.Queue()
+    messages = MessageLog(xsize)
+    world, player, renderers = build_world(term, screen, dmap, mq, xsize, ysize,
+                                           profiler, render=False)
+    rng = random.Random(seed)
+    floor = dmap.mapArr.find(FLOOR)
+    for _ in range(enemies):
+        x, y = rng.choice(floor)
+        spawn_enemy(world, x, y, term.TK_GREEN, mode='chase',
+                    speed=rng.choice([50, 80, 100]))
+
+    latency = LatencyHistogram()
+    thinking = LatencyHistogram()
+    clock = time.perf_counter
+    start = clock()
+    for turn in range(turns):
+        before = clock()
+        move = policy(world, player, rng)
+        thinking.add(clock() - before)
+        before = clock()
+        if not player_action(world, player, move):
+            player_action(world, player, False)
+        world.process()
+        while not mq.empty():
+            messages.add(mq.get())
+        if render_every and turn % render_every == 0:
+            for renderer in renderers:
+                renderer.process()
+            screen.refresh()
+        latency.add(clock() - before)
+    return clock() - start, latency, thinking
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the game world headless with a bot")
+    parser.add_argument('turns', type=int, nargs='?', default=100000)
+    parser.add_argument('--bot', default='explore', choices=sorted(BOTS))
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--size', default='24x16', help="WIDTHxHEIGHT")
+    parser.add_argument('--enemies', type=int, default=0,
+                        help="extra monsters chasing the player")
+    parser.add_argument('--render-every', type=int, default=0,
+                        help="draw every N turns, 0 never draws")
+    parser.add_argument('--profile', action='store_true',
+                        help="time each processor")
+    args = parser.parse_args()
+
+    size = tuple(int(v) for v in args.size.split('x'))
+    profiler = Profiler() if args.profile else None
+    secs, latency, thinking = simulate(args.turns, BOTS[args.bot], args.seed, size,
+                                       args.enemies, args.render_every, profiler)
+    print("{} turns in {:.2f}s ({:.2f}s of it the bot), {:.0f} turns/sec "
+          "without the bot".format(args.turns, secs, thinking.total,
+                                   args.turns / latency.total))
+    for name, hist in (("turn", latency), ("bot", thinking)):
+        print("{:<5} latency  p50 {:.1f}us  p99 {:.1f}us  max {:.1f}us".format(
+            name, hist.percentile(50) * 1e6, hist.percentile(99) * 1e6,
+            hist.max * 1e6))
+    if profiler is not None:
+        for line in profiler.lines(40):
+            print(line)